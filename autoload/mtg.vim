@@ -62,8 +62,19 @@ endOfPython
         """""""""""""
 
         python3 from vim_mtg import deck, card
+        python3 from vim_mtg import cache
+        python3 from vim_mtg import names
+        python3 from vim_mtg import database
+        python3 from vim_mtg import worker
+        python3 from vim_mtg import profiler
+        python3 from contextlib import nullcontext
         python3 from vim_mtg import vim_interface
 
+        augroup mtg_database
+            autocmd!
+            autocmd VimLeave * python3 worker.shutdown(); database.close()
+        augroup END
+
     " else
     "     call mtg#warning("vim-mtg already initialized")
     endif
@@ -85,6 +96,10 @@ function! mtg#reinit_python() abort
     py3 import importlib
     py3 import mtgcard
     py3 importlib.reload(mtgcard)
+    py3 importlib.reload(cache)
+    py3 database.close()
+    py3 importlib.reload(database)
+    py3 importlib.reload(names)
     py3 importlib.reload(deck)
     py3 importlib.reload(card)
     py3 importlib.reload(vim_interface)
@@ -104,24 +119,189 @@ endfunction
 "                             Python Functions                              
 "---------------------------------------------------------------------------
 
-function! mtg#process_deck() abort
+function! mtg#process_deck(...) abort
+    " optional arguments:
+    "   1. if true, process the whole deck again
+    "   2. profile: list of captures (see mtg#profile()); implies 1.
+    let l:force = get(a:000, 0, 0)
+    let l:profile = get(a:000, 1, '')
 python3 << endPython
 # get settings
 ansi = vim_interface.settings.get('ansi', 'bool')
 main_sectioned = vim_interface.settings.get('main_sectioned', 'bool')
 process_other = vim_interface.settings.get('process_other', 'bool')
+options = (main_sectioned, process_other, ansi)
+
+# profile the run, if requested
+profile = vim.eval('l:profile')
+prof = None
+if profile != '':
+    prof = profiler.Profiler(cprofile='cprofile' in profile,
+                             memory='memory' in profile)
+
+# state of the previous run on this buffer
+bufnr = vim.current.buffer.number
+if (int(vim.eval('l:force')) or prof is not None
+        or bufnr not in cache.process_states):
+    cache.process_states[bufnr] = deck.ProcessState()
+state = cache.process_states[bufnr]
+tick = int(vim.eval('b:changedtick'))
+if worker.running(('process', bufnr)):
+    # the state is in use by a background run (its result will be stale)
+    state = deck.ProcessState()
+
+# process buffer, unless unchanged since the previous run
+if state.tick != tick or state.options != options:
+    try:
+        with (prof.run() if prof else nullcontext()):
+            b = deck.process_deck(list(vim.current.buffer),
+                main_sectioned=main_sectioned, process_other=process_other,
+                ansi=ansi, state=state, profiler=prof)
+            # update buffer
+            with (prof.phase('buffer write') if prof else nullcontext()):
+                if vim.current.buffer[:] != b:
+                    vim.current.buffer[:] = b
+    except FileNotFoundError as e:
+        vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
+    else:
+        state.tick = int(vim.eval('b:changedtick'))
+        state.options = options
+        if prof is not None:
+            header = ['viMTG profile: {} ({} lines)'.format(
+                      vim.current.buffer.name, len(b)), '']
+            vim.vars['mtg_profile_report'] = header + prof.report()
+endPython
+endfunction
 
-# process buffer
-try:
-    b = deck.process_deck(list(vim.current.buffer),
-        main_sectioned=main_sectioned, process_other=process_other, ansi=ansi)
-except FileNotFoundError as e:
-    vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
+
+function! mtg#profile(...) abort
+    " process the deck, timing its phases, and show the report in a scratch
+    " buffer; arguments: 'cprofile' and/or 'memory' to capture them
+    for l:capture in a:000
+        if index(['cprofile', 'memory'], l:capture) == -1
+            call mtg#error("invalid profile capture: ".l:capture)
+            return
+        endif
+    endfor
+    unlet! g:mtg_profile_report
+    call mtg#process_deck(1, a:000)
+    if !exists('g:mtg_profile_report')
+        return
+    endif
+    new
+    setlocal buftype=nofile bufhidden=wipe noswapfile nobuflisted
+    execute 'silent file mtg_profile_'.bufnr('')
+    call setline(1, g:mtg_profile_report)
+    unlet g:mtg_profile_report
+    setlocal nomodified
+endfunction
+
+
+function! mtg#profile_complete(arglead, cmdline, cursorpos) abort
+    return "cprofile\nmemory"
+endfunction
+
+
+function! mtg#process(...) abort
+    " process the deck, in the background if g:mtg_process_async is set
+    let l:force = get(a:000, 0, 0)
+    if get(g:, 'mtg_process_async', 0) && has('timers')
+        call mtg#process_deck_async(l:force)
+    else
+        call mtg#process_deck(l:force)
+    endif
+endfunction
+
+
+function! mtg#process_deck_async(...) abort
+    " process the deck on a worker thread; the result is applied by a timer if
+    " the buffer did not change in the meantime
+    let l:force = get(a:000, 0, 0)
+    call s:start_process(bufnr(''), l:force)
+endfunction
+
+
+function! s:start_process(bufnr, force) abort
+python3 << endPython
+# get settings
+ansi = vim_interface.settings.get('ansi', 'bool')
+main_sectioned = vim_interface.settings.get('main_sectioned', 'bool')
+process_other = vim_interface.settings.get('process_other', 'bool')
+options = (main_sectioned, process_other, ansi)
+
+# state of the previous run on this buffer
+bufnr = int(vim.eval('a:bufnr'))
+key = ('process', bufnr)
+if int(vim.eval('a:force')) or bufnr not in cache.process_states:
+    cache.process_states[bufnr] = deck.ProcessState()
+state = cache.process_states[bufnr]
+tick = int(vim.eval('getbufvar(a:bufnr, "changedtick")'))
+
+if worker.running(key):
+    # process again when the running job is done
+    worker.jobs[key].rerun = True
+elif state.tick != tick or state.options != options:
+    # process a snapshot of the buffer in the background
+    job = worker.start(key,
+        lambda job, **kwargs: deck.process_deck(progress=job.set_progress,
+                                                **kwargs),
+        blist=list(vim.buffers[bufnr]), main_sectioned=main_sectioned,
+        process_other=process_other, ansi=ansi, state=state)
+    job.tick = tick
+    job.state = state
+    job.options = options
+    job.rerun = False
+    vim.buffers[bufnr].vars['mtg_process_status'] = 'processing'
+    vim.command("call timer_start(100, function('s:poll_process', [a:bufnr]),"
+                " {'repeat': -1})")
+endPython
+    redrawstatus
+endfunction
+
+
+function! s:poll_process(bufnr, timer) abort
+python3 << endPython
+bufnr = int(vim.eval('a:bufnr'))
+key = ('process', bufnr)
+job = worker.jobs.get(key)
+vim_interface.flush_messages()
+if job is None or not int(vim.eval('bufexists(a:bufnr)')):
+    vim.command('call timer_stop(a:timer)')
+    worker.jobs.pop(key, None)
+elif not job.done():
+    vim.buffers[bufnr].vars['mtg_process_status'] = \
+        'processing {}'.format(job.progress)
 else:
-    # update buffer
-    if vim.current.buffer[:] != b:
-        vim.current.buffer[:] = b
+    vim.command('call timer_stop(a:timer)')
+    del worker.jobs[key]
+    status = ''
+    try:
+        b = job.result()
+    except FileNotFoundError as e:
+        vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
+    else:
+        tick = int(vim.eval('getbufvar(a:bufnr, "changedtick")'))
+        if tick == job.tick:
+            # update buffer
+            if vim.buffers[bufnr][:] != b:
+                vim.buffers[bufnr][:] = b
+            job.state.tick = int(vim.eval('getbufvar(a:bufnr, "changedtick")'))
+            job.state.options = job.options
+        elif job.rerun:
+            vim.command('call s:start_process(a:bufnr, 0)')
+            status = None
+        else:
+            status = 'stale result discarded'
+    if status is not None:
+        vim.buffers[bufnr].vars['mtg_process_status'] = status
 endPython
+    redrawstatus
+endfunction
+
+
+function! mtg#process_status() abort
+    " status of the background processing of the deck (for 'statusline')
+    return get(b:, 'mtg_process_status', '')
 endfunction
 
 
@@ -135,10 +315,25 @@ except ValueError as e:
     vim_interface.vim_warning(str(e))
 except FileNotFoundError as e:
     vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
+else:
+    # preview the neighboring cards in the background
+    first, last = card.prefetch(vim.current.buffer,
+        vim.current.window.cursor[0]-1, verbose=verbose_print, ansi=ansi)
+    vim.current.buffer.vars['mtg_prefetch_lines'] = [first+1, last+1]
 endPython
 endfunction
 
 
+function! mtg#check_prefetch() abort
+    " cancel the prefetch of previews if the cursor left its card lines
+    let l:lines = get(b:, 'mtg_prefetch_lines', [])
+    if !empty(l:lines) && (line('.') < l:lines[0] || line('.') > l:lines[1])
+        unlet b:mtg_prefetch_lines
+        call py3eval('card.cancel_prefetch('.bufnr('').')')
+    endif
+endfunction
+
+
 function! mtg#card_preview(name, ...) abort
     let l:setcode = get(a:000, 0, -1)
 python3 << endPython
@@ -173,12 +368,43 @@ if multibuf:
     searchfile = None
 else:
     searchfile = vim.eval("s:searchfile")
+background = bool(int(vim.eval("has('timers')")))
 try:
-    card.search(vim.current.buffer, query, format=format, order=order,
-        reverse=reverse, searchfile=searchfile, ansi=ansi)
+    job = card.search(vim.current.buffer, query, format=format, order=order,
+        reverse=reverse, searchfile=searchfile, ansi=ansi,
+        background=background)
 except FileNotFoundError as e:
     vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
+else:
+    if background and job is not None:
+        vim.command("call timer_start(50, function('s:poll_search',"
+                    " [{}, {}]), {{'repeat': -1}})".format(
+                    job.bufnr, job.generation))
 endPython
+    redrawstatus
+endfunction
+
+
+function! s:poll_search(bufnr, generation, timer) abort
+    if py3eval('card.poll_search('.a:bufnr.', '.a:generation.')')
+        call timer_stop(a:timer)
+        redrawstatus!
+    endif
+endfunction
+
+
+function! mtg#search_status() abort
+    " status of the search in the search buffer (for 'statusline')
+    return get(b:, 'mtg_search_status', '')
+endfunction
+
+
+function! mtg#search_more() abort
+    " append the next page of search results when the cursor nears the end
+    if line('$') - line('.') > 2 * winheight(0)
+        return
+    endif
+    python3 card.search_more(vim.current.buffer)
 endfunction
 
 
@@ -194,16 +420,23 @@ linenr = int(vim.eval("get(l:dict, 'linenr', -1)"))
 if bufnr == -1: bufnr = None
 if linenr == -1: linenr = None
 
+# state of the last run, to update the stats section
+state = cache.process_states.get(bufnr or vim.current.buffer.number)
+if worker.running(('process', bufnr or vim.current.buffer.number)):
+    state = None
+
 if bufnr is None:
     blist = list(vim.current.buffer[:])
     try:
-        vim.current.buffer[:] = deck.add_to_section(blist, name, count, section_nr)
+        vim.current.buffer[:] = deck.add_to_section(blist, name, count, section_nr,
+                                                    state=state)
     except FileNotFoundError as e:
         vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
 else:
     blist = list(vim.buffers[bufnr][:])
     try:
-        vim.buffers[bufnr][:] = deck.add_to_section(blist, name, count, section_nr)
+        vim.buffers[bufnr][:] = deck.add_to_section(blist, name, count, section_nr,
+                                                    state=state)
     except FileNotFoundError as e:
         vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
 endPython
@@ -217,9 +450,16 @@ section_nr = int(vim.eval('a:section_nr'))
 count = int(vim.eval('get(a:000, 0, 0)'))
 if count == 0: count = None
 
+# state of the last run, to update the stats section
+bufnr = vim.current.buffer.number
+state = cache.process_states.get(bufnr)
+if worker.running(('process', bufnr)):
+    state = None
+
 # move card
 try:
-    b = deck.move_card(list(vim.current.buffer), index, section_nr, count=count)
+    b = deck.move_card(list(vim.current.buffer), index, section_nr, count=count,
+                       state=state)
 except FileNotFoundError as e:
     vim_interface.vim_error("MTG database not found: run ':MTGUpdate'")
     vim.command("return 0")
@@ -266,52 +506,65 @@ function! mtg#update() abort
 python3 << endPython
 import mtgcard.update
 print("updating database...")
+database.close()
 mtgcard.update.update_database(verbose=False)
+cache.clear()
+print("indexing card names...")
+names.write_names_files()
 print("update complete")
 endPython
 endfunction
 
+
+function! mtg#set_cache_size(size) abort
+    call py3eval('cache.cards.resize('.a:size.')')
+endfunction
+
+
+function! mtg#clear_cache() abort
+    python3 cache.clear()
+endfunction
+
+
+function! mtg#forget_buffer(bufnr) abort
+    " drop the state kept for buffer number a:bufnr
+    call py3eval('cache.process_states.pop('.a:bufnr.', None)')
+    call py3eval('cache.documents.pop('.a:bufnr.', None)')
+    call py3eval('cache.searches.pop('.a:bufnr.', None)')
+    call py3eval('card.cancel_prefetch('.a:bufnr.')')
+endfunction
+
 "-------------------------------------------------------------------------------
 "                                Vim Functions                                  
 "-------------------------------------------------------------------------------
 
-function! mtg#error(message) abort
-    echohl Error | echo "error: ".a:message | echohl | exe "normal \<esc>"
+function! mtg#error(message, ...) abort
+    " optional argument: if true, do not leave the current mode
+    echohl Error | echo "error: ".a:message | echohl
+    if !get(a:000, 0, 0) | exe "normal \<esc>" | endif
 endfunction
 
-function! mtg#warning(message) abort
-    echohl WarningMsg | echo "warning: ".a:message | echohl | exe "normal \<esc>"
+function! mtg#warning(message, ...) abort
+    " optional argument: if true, do not leave the current mode
+    echohl WarningMsg | echo "warning: ".a:message | echohl
+    if !get(a:000, 0, 0) | exe "normal \<esc>" | endif
 endfunction
 
-function! mtg#list_names() abort
-    " cache to s:nameslist and use cache if 'format' is the same
-    if ! exists('s:lastformat')
-        let s:lastformat = ''
-    endif
-    if exists('s:curformat')
-        let s:lastformat = s:curformat
-    endif
-    let s:curformat = g:mtg_default_format
-    if s:curformat == s:lastformat && exists('s:nameslist')
-        return s:nameslist
-    else
-        python3 << endOfPython
+function! mtg#names_file() abort
+    " path of the file listing the card names of g:mtg_default_format, or ''
+    " if there is no database
+python3 << endOfPython
 try:
-    nameslist = card.list_names(vim.eval("s:curformat"))
+    names_file = names.names_file(vim.eval("g:mtg_default_format"))
 except FileNotFoundError as e:
-    vim.command("return -1")
+    names_file = ''
 endOfPython
-        let s:nameslist = py3eval("nameslist")
-        return s:nameslist
-    endif
-endfunction
-
-function! mtg#reset_names_cache() abort
-    unlet s:nameslist
+    return py3eval('names_file')
 endfunction
 
 function! mtg#get_section() abort
-    return py3eval('deck.get_section(vim.current.buffer[:], vim.current.window.cursor[0]-1)')
+    let l:doc = 'deck.buffer_document(vim.current.buffer, '.b:changedtick.')'
+    return py3eval('deck.get_section('.l:doc.', vim.current.window.cursor[0]-1)')
 endfunction
 
 function! mtg#add_to_current(name) abort
@@ -321,14 +574,15 @@ function! mtg#add_to_current(name) abort
         call mtg#warning("no current section found")
         return 0
     endif
-    call mtg#add_to_deck(a:name, 1, mtg#get_section())
+    call mtg#add_to_deck(a:name, 1, l:section)
 endfunction
 
 function! mtg#add() abort
     if exists('g:loaded_fzf') && g:loaded_fzf == 1
-        let names = mtg#list_names()
-        if type(names) == v:t_list
-            call fzf#run({'source': names, 'sink': function('mtg#add_to_current'), 'down': '~40%'})
+        let l:file = mtg#names_file()
+        if l:file != ''
+            let l:source = (has('win32') ? 'type ' : 'cat ').shellescape(l:file)
+            call fzf#run({'source': l:source, 'sink': function('mtg#add_to_current'), 'down': '~40%'})
         else
             call mtg#error("MTG database not found: run ':MTGUpdate'")
         endif
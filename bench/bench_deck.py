@@ -0,0 +1,362 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Benchmarks of the deck and card hot paths against a stub card database.
+
+Usage (from `vim-mtg/`):
+
+    python3 bench/bench_deck.py [--latency SECONDS] [--sizes N,...]
+                                [--threshold RATIO] [--save]
+
+Synthetic decks of 60 to 20,000 lines are processed with a stub database
+(`StubInterface`) answering each lookup after `--latency` seconds, and as
+many cards are previewed and searched (with stub query parsing and card
+images). For each
+operation and deck size, the time (best of at least `--repeat` runs), the memory
+allocations (blocks and peak KiB, from tracemalloc), and the database calls
+are reported.
+
+The times are compared with `bench/baseline.json` (written with `--save`,
+on the same machine): the run fails (exit status 1) if an operation is
+slower than `--threshold` times its baseline (and by more than `--min-delta`
+seconds), or makes more database calls.
+
+The import time budget of the modules loaded when a deck buffer is opened
+is checked by the unit tests only on request:
+
+    VIM_MTG_BENCH=1 python3 -m unittest tests/test_imports.py
+
+"""
+
+
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import cache
+from vim_mtg import card
+from vim_mtg import deck
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        'baseline.json')
+
+SIZES = [60, 250, 1000, 5000, 20000]
+
+# minimum time (seconds) and maximum number of timed runs per operation
+MIN_TIME = 0.2
+MAX_RUNS = 200
+
+# (type, types, manacost, cmc) of the synthetic cards
+CARD_KINDS = [
+        ('Creature — Human', ['Creature'], '{R}', 1),
+        ('Creature — Elf', ['Creature'], '{1}{G}{G}', 3),
+        ('Instant', ['Instant'], '{U}{U}', 2),
+        ('Sorcery', ['Sorcery'], '{2}{B/R}', 3),
+        ('Enchantment', ['Enchantment'], '{3}{W}{W}', 5),
+        ('Artifact', ['Artifact'], '{7}', 7),
+        ('Legendary Planeswalker — Chandra', ['Planeswalker'], '{2}{R}{R}', 4),
+        ('Basic Land — Mountain', ['Land'], None, 0),
+        ]
+
+FORMATS = {'standard': 'Legal', 'modern': 'Legal', 'legacy': 'Legal',
+           'vintage': 'Legal', 'commander': 'Legal'}
+
+
+class StubCard:
+    """A card of the stub database."""
+
+    def __init__(self, name, index):
+        (self.type, self.types, self.manacost, self.cmc) = \
+                CARD_KINDS[index % len(CARD_KINDS)]
+        self.name = name
+        self.setcode = 'STB'
+        self.formats = FORMATS
+        self.layout = 'normal'
+        self.price = 0.25
+
+    def print_card(self, ansi=True):
+        return self.name
+
+
+class StubInterface:
+    """A stub card database answering lookups after `latency` seconds.
+
+    :param float latency: seconds per lookup
+
+    Card names are 'Card #N'; other names are not found. A search query (as
+    parsed by :func:`stub_parse`) 'n:N' matches cards 'Card #0' to 'Card #N-1'.
+
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def get_card(self, name, setcode=None, verbose=False):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if not name.lower().startswith('card #'):
+            raise ValueError("card not found")
+        try:
+            index = int(name[6:])
+        except ValueError as e:
+            raise ValueError("card not found")
+        return StubCard('Card #{}'.format(index), index)
+
+    def get_cards(self, pquery, sort='cmc', reverse=False):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        cards = [StubCard('Card #{}'.format(i), i)
+                 for i in range(int(pquery[2:]))]
+        cards.sort(key=lambda c: getattr(c, sort) or 0, reverse=reverse)
+        return cards or None
+
+
+def stub_parse(query):
+    """Return search query `query` as parsed (see
+    :meth:`StubInterface.get_cards`)."""
+    if not query.startswith('n:'):
+        # e.g., 'format:modern n:N'
+        query = query.split()[-1]
+    return query
+
+
+def stub_images(cards, n, image=False, ansi=True):
+    """Return the lines of the images of `cards`, `n` per row, as
+    `mtgcard.list_cards_images` would (one line of names per row)."""
+    return ['  '.join(c.name for c in cards[i:i+n])
+            for i in range(0, len(cards), n)]
+
+
+class StubNames(dict):
+    """The name index (see :data:`cache.names`) of the stub database."""
+
+    def get(self, key, default=None):
+        if key.startswith('card #') and key[6:].isdigit():
+            return 'Card #{}'.format(int(key[6:]))
+        return default
+
+
+def load_stub_index():
+    """Fill the name index with :class:`StubNames`, instead of the names file
+    (see :func:`names.load_index`)."""
+    if cache.names is None:
+        cache.names = StubNames()
+    return True
+
+
+def synthetic_deck(size, seed=0):
+    """Return a deck buffer list of about `size` lines.
+
+    Cards are spread over Main (70%), Sideboard (20%), and Other (10%), with
+    a few blank lines, repeated cards, and invalid lines.
+
+    """
+    r = random.Random(seed)
+    distinct = max(size // 3, 10)
+
+    def lines(n):
+        result = []
+        for i in range(n):
+            x = r.random()
+            if x < 0.02:
+                result.append('')
+            elif x < 0.03:
+                result.append('1 Not A Card {}'.format(i))
+            else:
+                result.append('{} Card #{}'.format(r.randint(1, 4),
+                                                   r.randrange(distinct)))
+        return result
+
+    n_main = size * 7 // 10
+    n_sb = size * 2 // 10
+    n_other = max(size - n_main - n_sb - 3, 0)
+    return ([deck.DECK_MAIN] + lines(n_main) + [deck.DECK_SB] + lines(n_sb)
+            + [deck.DECK_OTHER] + lines(n_other))
+
+
+def operations(size):
+    """Return the benchmarked operations on a deck of `size` lines.
+
+    Each operation is (name, setup, run): `setup()` returns the argument of
+    `run`, and is not measured.
+
+    """
+    b = synthetic_deck(size)
+    main = deck.find_section(b, 1)
+    moved = list(range(main[0]+1, main[0]+1 + (main[1]-main[0])//2))
+
+    previewed = ['Card #{}'.format(i) for i in range(max(size // 3, 10))]
+    query = 'n:{}'.format(size)
+
+    def search_pages(cards):
+        results = card.SearchResults(cards, ansi=False)
+        while not results.done():
+            results.next_page()
+
+    def incremental():
+        state = deck.ProcessState()
+        deck.process_deck(list(b), state=state, ansi=False)
+        edited = list(b)
+        edited[1] = '4 Card #0'
+        return (edited, state)
+
+    return [
+        ('find_section', lambda: b, lambda b: deck.find_section(b, 2)),
+        ('get_section', lambda: b, lambda b: deck.get_section(b, len(b)-1)),
+        ('get_deck', lambda: b[1:main[1]+1],
+            lambda lines: deck.get_deck(lines, verbose=True, warnings=False)),
+        ('move_cards', lambda: list(b),
+            lambda b: deck.move_cards(b, moved, 2)),
+        ('process_deck', lambda: list(b),
+            lambda b: deck.process_deck(b, main_sectioned=True, ansi=False)),
+        ('process_deck_incremental', incremental,
+            lambda args: deck.process_deck(args[0], state=args[1],
+                                           ansi=False)),
+        ('render_preview', lambda: previewed,
+            lambda names: [card.render_preview(name, ansi=False)
+                           for name in names]),
+        ('find_cards', lambda: query,
+            lambda query: card.find_cards(query, 'modern', order='name')),
+        ('search_results',
+            lambda: StubInterface().get_cards(query, sort='name'),
+            search_pages),
+        ]
+
+
+def measure(setup, run, db, repeat):
+    """Return (seconds, allocated blocks, peak KiB, database calls)."""
+    # time: best of at least `repeat` runs (more for fast operations, up to
+    # MIN_TIME in total), each with an empty card cache
+    best = None
+    total = 0
+    runs = 0
+    while runs < repeat or (total < MIN_TIME and runs < MAX_RUNS):
+        arg = setup()
+        cache.clear()
+        db.calls = 0
+        gc.disable()
+        start = time.perf_counter()
+        run(arg)
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        calls = db.calls
+        best = elapsed if best is None else min(best, elapsed)
+        total += elapsed
+        runs += 1
+
+    # allocations: one more run, traced
+    arg = setup()
+    cache.clear()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run(arg)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(max(s.count_diff, 0)
+                 for s in after.compare_to(before, 'filename'))
+
+    return (best, blocks, peak / 1024, calls)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+            description="Benchmark the deck hot paths.")
+    parser.add_argument('--latency', type=float, default=0.0,
+            help="seconds per database lookup (default: 0)")
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+            help="deck sizes in lines (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=3,
+            help="timed runs per operation (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, default=2.0,
+            help="slowdown ratio failing the run (default: %(default)s)")
+    parser.add_argument('--min-delta', type=float, default=0.002,
+            help="slowdown in seconds below which an operation is not "
+                 "compared, as noise (default: %(default)s)")
+    parser.add_argument('--save', action='store_true',
+            help="save the results as the baseline")
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    db = StubInterface(args.latency)
+    cache.cards.resize(100000)
+    results = {}
+    failures = []
+    print('{:<26s}{:>7s}{:>11s}{:>10s}{:>11s}{:>8s}{:>9s}'.format(
+          'operation', 'lines', 'time (ms)', 'blocks', 'peak KiB', 'db',
+          'vs base'))
+    with patch('vim_mtg.database.interface', return_value=db), \
+            patch('vim_mtg.names.load_index', load_stub_index), \
+            patch('mtgcard.parser.parser.parse', stub_parse), \
+            patch('mtgcard.mtgcard.list_cards_images', stub_images):
+        for size in [int(s) for s in args.sizes.split(',')]:
+            for (name, setup, run) in operations(size):
+                (seconds, blocks, peak, calls) = measure(setup, run, db,
+                                                         args.repeat)
+                key = '{}/{}'.format(name, size)
+                results[key] = {'seconds': seconds, 'blocks': blocks,
+                                'peak_kib': peak, 'db_calls': calls}
+                ratio = ''
+                base = baseline.get(key)
+                if base is not None and base['seconds'] > 0:
+                    r = seconds / base['seconds']
+                    ratio = '{:.2f}x'.format(r)
+                    if (r > args.threshold
+                            and seconds - base['seconds'] > args.min_delta):
+                        failures.append('{}: {:.2f}x slower'.format(key, r))
+                    if calls > base['db_calls']:
+                        failures.append('{}: {} database calls (was {})'
+                                .format(key, calls, base['db_calls']))
+                print('{:<26s}{:>7d}{:>11.2f}{:>10d}{:>11.1f}{:>8d}{:>9s}'
+                      .format(name, size, seconds*1000, blocks, peak, calls,
+                              ratio))
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=4, sort_keys=True)
+            f.write('\n')
+        print('baseline saved: {}'.format(BASELINE))
+        return 0
+
+    for failure in failures:
+        print('REGRESSION: ' + failure, file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
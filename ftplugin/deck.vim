@@ -56,6 +56,10 @@ let g:mtg_multiple_search_buffers = get(g:, 'mtg_multiple_search_buffers', 0)
 let g:mtg_default_format = get(g:, 'mtg_default_format', '')
 let g:mtg_preview_show_price = get(g:, 'mtg_preview_show_price', 1)
 let g:mtg_preview_verbose = get(g:, 'mtg_preview_verbose', 0)
+let g:mtg_card_cache_size = get(g:, 'mtg_card_cache_size', 1000)
+let g:mtg_process_async = get(g:, 'mtg_process_async', 0)
+
+call mtg#set_cache_size(g:mtg_card_cache_size)
 
 " mappings
 let g:mtg_process_command = get(g:, 'g:mtg_process_command', '<localleader>p')
@@ -81,7 +85,7 @@ let g:mtg_set_format_command = get(g:, 'mtg_set_format_command', '<localleader>f
 "-------------------------------------------------------------------------------
 
 " commands
-command! -buffer MTGDeck call mtg#process_deck()
+command! -buffer -bang MTGDeck call mtg#process(<bang>0)
 command! -buffer -nargs=1 -bang MTGSearch call mtg#card_search(
             \ <f-args>,
             \ ('<bang>'=='!'?1:0))
@@ -89,11 +93,14 @@ command! -buffer MTGOrder call mtg#set_order()
 command! -buffer MTGFormat call mtg#set_format()
 command! -buffer MTGSwitch call mtg#switch()
 command! -buffer MTGUpdate call mtg#update()
+command! -buffer MTGClearCache call mtg#clear_cache()
+command! -buffer -nargs=* -complete=custom,mtg#profile_complete MTGProfile
+            \ call mtg#profile(<f-args>)
 
 " mappings
 if ! g:mtg_no_maps
     if len(g:mtg_preview_command)
-        execute 'nnoremap <silent> <buffer> '.g:mtg_process_command.' :call mtg#process_deck()<cr>'
+        execute 'nnoremap <silent> <buffer> '.g:mtg_process_command.' :call mtg#process()<cr>'
     endif
     if len(g:mtg_add_command)
         execute 'nnoremap <silent> <buffer> '.g:mtg_add_command.' :call mtg#add()<cr>'
@@ -143,6 +150,17 @@ if ! g:mtg_no_maps
 endif
 
 
+"-------------------------------------------------------------------------------
+"                                  autocommands                                 
+"-------------------------------------------------------------------------------
+
+augroup mtg_deck_buffer
+    autocmd! * <buffer>
+    autocmd BufWipeout <buffer> call mtg#forget_buffer(expand('<abuf>'))
+    autocmd CursorMoved <buffer> call mtg#check_prefetch()
+augroup END
+
+
 "-------------------------------------------------------------------------------
 "                                   folding                                     
 "-------------------------------------------------------------------------------
@@ -61,6 +61,7 @@ command! -buffer -nargs=1 -bang MTGSearch call mtg#card_search(
             \ <f-args>,
             \ ('<bang>'=='!'?1:0))
 command! -buffer MTGOrder call mtg#set_order()
+command! -buffer MTGClearCache call mtg#clear_cache()
 
 " mappings
 if ! g:mtg_no_maps
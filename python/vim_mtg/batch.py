@@ -0,0 +1,201 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Process deck files outside of Vim.
+
+Usage:
+
+    python -m vim_mtg.batch [-j JOBS] [-o OUTPUT] [--log LOG] DIRECTORY
+
+Each '*.deck' file of DIRECTORY is processed as with `:MTGDeck`, on all CPU
+cores by default. For each deck, OUTPUT (default DIRECTORY/processed) gets
+the processed deck and a JSON summary of its Main section stats. Warnings
+(e.g., invalid lines) and errors are written to LOG (default
+OUTPUT/batch.log) as JSON lines:
+
+    {"deck": "burn.deck", "level": "WARNING", "message": "..."}
+
+"""
+
+
+import argparse
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from vim_mtg import deck
+from vim_mtg.vim_interface import log
+
+
+class DatabaseNotFoundError(Exception):
+    """The card database does not exist."""
+
+
+class _Records(logging.Handler):
+    """A logging handler keeping the records it handles."""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def summary(stats):
+    """Return a JSON-serializable summary of :class:`deck.DeckStats` `stats`.
+
+    Example return value:
+
+        {
+            'cards': 60,
+            'lands': 20,
+            'nonlands': 40,
+            'cmc': 92,
+            'avg_cmc': 2.3,
+            'mana_curve': [0, 12, 16, 8, 4, 0, 0],
+            'devotion': {'R': 44},
+            'legal_formats': ['legacy', 'modern', 'vintage']
+        }
+
+    """
+    if stats is None:
+        stats = deck.DeckStats()
+    result = {'cards': stats.total}
+    result.update(stats.stats())
+    result['mana_curve'] = stats.mana_curve()
+    result['devotion'] = stats.devotion()
+    result['legal_formats'] = sorted(stats.legal_formats())
+    return result
+
+
+def process_file(path, output, main_sectioned=True, process_other=True):
+    """Process deck file `path` into directory `output`.
+
+    :param str  path:           path of a deck file
+    :param str  output:         output directory
+    :param bool main_sectioned: whether main deck is sectioned by card type
+    :param bool process_other:  whether to process section Other
+    :raises DatabaseNotFoundError: if the card database does not exist
+    :raises OSError:               if a file cannot be read or written
+
+    Return (summary, messages), with messages as [(level, message), ...].
+
+    """
+    with open(path) as f:
+        lines = f.read().splitlines()
+
+    # keep the messages of this deck, for the log only
+    records = _Records()
+    log.addHandler(records)
+    propagate = log.propagate
+    log.propagate = False
+    try:
+        state = deck.ProcessState()
+        lines = deck.process_deck(lines, main_sectioned=main_sectioned,
+                process_other=process_other, ansi=False, state=state)
+        result = summary(state.main_stats)
+    except FileNotFoundError as e:
+        raise DatabaseNotFoundError(str(e)) from e
+    finally:
+        log.removeHandler(records)
+        log.propagate = propagate
+
+    name = os.path.splitext(os.path.basename(path))[0]
+    with open(os.path.join(output, name + '.deck'), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    with open(os.path.join(output, name + '.json'), 'w') as f:
+        json.dump(result, f, indent=4, sort_keys=True)
+        f.write('\n')
+
+    messages = [(r.levelname, r.getMessage()) for r in records.records]
+    return (result, messages)
+
+
+def _process_file(args):
+    """Run :func:`process_file`, returning errors instead of raising them."""
+    try:
+        return process_file(*args)
+    except DatabaseNotFoundError as e:
+        raise
+    except Exception as e:
+        return (None, [('ERROR', '{}: {}'.format(type(e).__name__, e))])
+
+
+def main(argv=None):
+    """Run the batch processor with command line arguments `argv`.
+
+    Return the exit status: 0, 1 if a deck failed, or 2 if the card database
+    does not exist.
+
+    """
+    parser = argparse.ArgumentParser(prog='python -m vim_mtg.batch',
+            description="Process the '*.deck' files of a directory.")
+    parser.add_argument('directory', help="directory of '*.deck' files")
+    parser.add_argument('-o', '--output',
+            help="output directory (default: DIRECTORY/processed)")
+    parser.add_argument('--log',
+            help="log of warnings and errors (default: OUTPUT/batch.log)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+            help="number of processes (default: number of CPUs)")
+    parser.add_argument('--not-sectioned', action='store_true',
+            help="do not section the main deck by card type")
+    parser.add_argument('--no-other', action='store_true',
+            help="do not process section Other")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.join(args.directory, 'processed')
+    os.makedirs(output, exist_ok=True)
+    log_path = args.log or os.path.join(output, 'batch.log')
+
+    paths = sorted(os.path.join(args.directory, f)
+                   for f in os.listdir(args.directory) if f.endswith('.deck'))
+    tasks = [(p, output, not args.not_sectioned, not args.no_other)
+             for p in paths]
+
+    executor = None
+    if args.jobs != 1:
+        executor = ProcessPoolExecutor(max_workers=args.jobs)
+    failed = 0
+    try:
+        with open(log_path, 'w') as log_file:
+            if executor is None:
+                results = map(_process_file, tasks)
+            else:
+                results = executor.map(_process_file, tasks, chunksize=8)
+            for (path, (result, messages)) in zip(paths, results):
+                if result is None:
+                    failed += 1
+                for (level, message) in messages:
+                    json.dump({'deck': os.path.basename(path), 'level': level,
+                               'message': message}, log_file)
+                    log_file.write('\n')
+    except DatabaseNotFoundError as e:
+        print("MTG database not found: run ':MTGUpdate'", file=sys.stderr)
+        return 2
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    print("{} decks processed, {} failed (see {})".format(
+          len(paths) - failed, failed, log_path), file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Process-wide caches shared by the deck and card filetypes."""
+
+
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A bounded least recently used cache.
+
+    :param int maxsize: maximum number of entries (0 disables the cache)
+
+    Access is guarded by a lock, so a cache may be shared between threads.
+
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value of `key` and mark it as recently used."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError as e:
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """Set `key` to `value`, evicting the least recently used entries."""
+        with self._lock:
+            if self.maxsize <= 0:
+                return
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def resize(self, maxsize):
+        """Set the maximum number of entries to `maxsize`."""
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+
+
+# resolved cards as {(name.lower(), setcode, verbose): Card or None}
+cards = LRUCache(1000)
+
+# rendered previews as {(name.lower(), setcode, verbose, ansi, currency,
+# show_price): (lines, price)}
+previews = LRUCache(200)
+
+# search results as {fquery: (order, reverse, [Card, ...])}
+queries = LRUCache(8)
+
+# parsed search queries as {normalized query: parsed query or ValueError}
+queries_parsed = LRUCache(64)
+
+# deck processing state of each buffer as {bufnr: deck.ProcessState}
+process_states = {}
+
+# indexed deck buffers as {bufnr: (changedtick, deck.DeckDocument)}
+documents = {}
+
+# search results of each search buffer as {bufnr: card.SearchResults}; kept
+# by :func:`clear`, since they are still rendered as the buffer is scrolled
+searches = {}
+
+# canonical card names as {name.lower(): name}, or None until loaded from the
+# names file of all cards (see :func:`names.load_index`)
+names = None
+
+
+def set_names(nameslist):
+    """Set the name index to the list of all card names `nameslist`."""
+    global names
+    names = {name.lower(): name for name in nameslist}
+
+
+def clear():
+    """Clear all caches (e.g., after the database is updated)."""
+    global names
+    names = None
+    cards.clear()
+    previews.clear()
+    queries.clear()
+    queries_parsed.clear()
+    process_states.clear()
+    documents.clear()
@@ -18,43 +18,33 @@
 
 
 import re
+from itertools import count
 from os import path
 import vim
-import mtgcard.mtgcard
-import mtgcard.parser
-import mtgcard.util
+import mtgcard.settings
+from vim_mtg import cache
+from vim_mtg import database
 from vim_mtg import deck
+from vim_mtg import worker
 from vim_mtg.vim_interface import vim_error, vim_warning, settings
 
-from pprint import pprint
+# mtgcard.mtgcard, mtgcard.parser, and mtgcard.util are imported on first use,
+# to keep opening a deck buffer cheap; they are imported under aliases (e.g.,
+# `from mtgcard import util as _util`), since a function-local
+# `import mtgcard.util` would shadow the global `mtgcard` in the whole function
 
+# number of card images per row in search buffers
+CARDS_PER_ROW = 4
 
-def list_names(format=None):
-    """Return a list of all card names, or card names in `format` if specified.
+# number of cards rendered at a time in search buffers
+SEARCH_PAGE_SIZE = 48
 
-    :param str format: MTG format
+# number of card lines previewed in the background on each side of the cursor
+PREFETCH_CARDS = 3
 
-    Formats:
-
-        standard
-        pioneer
-        modern
-        commander
-        brawl
-        pauper
-        legacy
-        vintage
-
-    """
-    db = mtgcard.mtgdb.Interface()
-    if format:
-        query = 'format:%s' % (format,)
-    else:
-        query = ''
-    nameslist = mtgcard.mtgcard.list_cards(db, query, onlynames=True, onename=True)[0]
-    if nameslist:
-        nameslist = nameslist.splitlines()
-        return nameslist
+# generations of background searches, to tell a search from the next one in
+# the same buffer
+_search_generation = count(1)
 
 
 def preview_line(line, prevfile=None, verbose=False, ansi=True):
@@ -75,39 +65,142 @@ def preview_line(line, prevfile=None, verbose=False, ansi=True):
         vim_warning("card not found")
 
 
-def preview(name, setcode=None, prevfile=None, verbose=False, ansi=True):
-    """Preview card `name` in preview window.
+def render_preview(name, setcode=None, verbose=False, ansi=True,
+        show_price=True):
+    """Return the preview of card `name` as (lines, price), or None on fail.
 
-    :param str  name:     name of card to preview
-    :param str  setcode:  set code of card to preview
-    :param str  prevfile: preview file to use (default: automatically create)
-    :param bool verbose:  whether to display extra information in preview
-    :param bool ansi:     whether color
+    :param str  name:       name of card to preview
+    :param str  setcode:    set code of card to preview
+    :param bool verbose:    whether to display extra information in preview
+    :param bool ansi:       whether color
+    :param bool show_price: whether to fetch the price of the card
+
+    :raises ValueError: if the card is not found
+
+    Previews are kept in :data:`cache.previews`, so previewing a card again
+    does not fetch or render it again.
 
     """
-    db = mtgcard.mtgdb.Interface()
-    show_price = settings.get('preview_show_price', 'bool')
+    key = (name.lower(), setcode, verbose, ansi, mtgcard.settings.CURRENCY,
+           show_price)
+    rendered = cache.previews.get(key)
+    if rendered is not None:
+        return rendered
 
-    if show_price:
-        card = db.get_card(name, setcode, verbose=True)
-    else:
-        card = db.get_card(name, setcode)
+    card = deck.get_card(name, setcode, verbose=show_price)
 
     if verbose:
-        card_print = mtgcard.mtgcard.get_and_print_card(db, card=card,
+        from mtgcard import mtgcard as _mtgcard
+        db = database.interface()
+        card_print = _mtgcard.get_and_print_card(db, card=card,
                 verbose=True, ansi=ansi)
     else:
         card_print = card.print_card(ansi=ansi)
 
     if card.layout in ('transform', 'meld') and not verbose:
-        other_print = mtgcard.util.get_transform_meld_sideb(card).print_card(ansi=ansi)
+        from mtgcard import util as _util
+        other_print = _util.get_transform_meld_sideb(card).print_card(ansi=ansi)
         card_print += '\n' + other_print
 
-    if card_print is not None:
-        card_print = card_print.splitlines()
-    else:
+    if card_print is None:
+        return None
+    rendered = (card_print.splitlines(), card.price)
+    cache.previews.put(key, rendered)
+    return rendered
+
+
+def neighbor_cards(blist, linenr, n=PREFETCH_CARDS):
+    """Return the `n` card lines after and before line `linenr` of `blist`.
+
+    :param list blist:  buffer lines
+    :param int  linenr: line number (0-indexed)
+    :param int  n:      number of card lines on each side
+
+    Return a list of (name, setcode), nearest first (alternating after and
+    before), and the first and last line numbers searched.
+
+    """
+    after = []
+    before = []
+    limit = 10 * n
+    first = last = linenr
+    for i in range(linenr + 1, min(linenr + 1 + limit, len(blist))):
+        if len(after) == n:
+            break
+        last = i
+        match = deck.re_card_ln.match(blist[i])
+        if match:
+            after.append((match.group(2), match.group(3)))
+    for i in range(linenr - 1, max(linenr - 1 - limit, -1), -1):
+        if len(before) == n:
+            break
+        first = i
+        match = deck.re_card_ln.match(blist[i])
+        if match:
+            before.append((match.group(2), match.group(3)))
+    cards = []
+    for i in range(n):
+        cards += after[i:i+1] + before[i:i+1]
+    return cards, first, last
+
+
+def _prefetch(job, cards, verbose, ansi, show_price):
+    """Render the previews of `cards`, as (name, setcode), until cancelled."""
+    for name, setcode in cards:
+        if job.cancelled:
+            return
+        try:
+            render_preview(name, setcode, verbose=verbose, ansi=ansi,
+                           show_price=show_price)
+        except ValueError as e:
+            pass
+
+
+def prefetch(buf, linenr, verbose=False, ansi=True):
+    """Render the previews of the card lines around line `linenr` of deck
+    buffer `buf` in the background.
+
+    :param vim.buffer buf:     deck buffer
+    :param int        linenr:  line number (0-indexed)
+    :param bool       verbose: whether to display extra information in preview
+    :param bool       ansi:    whether color
+
+    A prefetch still running in `buf` is cancelled. Return the first and last
+    line numbers of the card lines (see :func:`cancel_prefetch`).
+
+    """
+    show_price = settings.get('preview_show_price', 'bool')
+    cards, first, last = neighbor_cards(buf, linenr)
+    worker.start(('prefetch', buf.number), _prefetch, cards, verbose=verbose,
+                 ansi=ansi, show_price=show_price)
+    return first, last
+
+
+def cancel_prefetch(bufnr):
+    """Cancel the prefetch of previews of deck buffer `bufnr`, if any."""
+    job = worker.jobs.pop(('prefetch', bufnr), None)
+    if job is not None:
+        job.cancel()
+
+
+def preview(name, setcode=None, prevfile=None, verbose=False, ansi=True):
+    """Preview card `name` in preview window.
+
+    :param str  name:     name of card to preview
+    :param str  setcode:  set code of card to preview
+    :param str  prevfile: preview file to use (default: automatically create)
+    :param bool verbose:  whether to display extra information in preview
+    :param bool ansi:     whether color
+
+    """
+    show_price = settings.get('preview_show_price', 'bool')
+
+    rendered = render_preview(name, setcode, verbose=verbose, ansi=ansi,
+                              show_price=show_price)
+    if rendered is None:
         vim_error("card not found")
         return None
+    card_print, price = rendered
 
     if prevfile is None:
         prevfile = vim.eval("tempname().'-mtg_card'")
@@ -137,8 +230,8 @@ def preview(name, setcode=None, prevfile=None, verbose=False, ansi=True):
 
             vim.current.buffer[:] = card_print
             if show_price:
-                if card.price is not None:
-                    price = '${:.2f}'.format(card.price * mtgcard.settings.US_TO_CUR_RATE)
+                if price is not None:
+                    price = '${:.2f}'.format(price * mtgcard.settings.US_TO_CUR_RATE)
                 else:
                     price = ''
                 vim.current.window.options['statusline'] = "[Preview] {}: {}".format(
@@ -166,39 +259,193 @@ def preview(name, setcode=None, prevfile=None, verbose=False, ansi=True):
             return True
 
 
+def sort_cards(cards, order='cmc', reverse=False):
+    """Return `cards` sorted by `order`, ties sorted by name.
+
+    :param list cards:   cards to sort
+    :param str  order:   sort order (cmc, name, price, or setcode)
+    :param bool reverse: whether to reverse order
+
+    Cards without a value for `order` (e.g., no price) are sorted last.
+
+    """
+    cards = sorted(cards, key=lambda c: c.name or '')
+    known = [c for c in cards if getattr(c, order) is not None]
+    unknown = [c for c in cards if getattr(c, order) is None]
+    known.sort(key=lambda c: getattr(c, order), reverse=reverse)
+    return known + unknown
+
+
+def format_query(query, format=None):
+    """Return search query `query` restricted to `format`, if any."""
+    if not format:
+        return query
+    if query:
+        return 'format:%s %s' % (format, query)
+    return 'format:%s' % (format,)
+
+
+def normalize_query(query):
+    """Return `query` stripped, with whitespace outside of quotes collapsed."""
+    parts = re.split(r'("[^"]*")', query.strip())
+    return ''.join(part if i % 2 else re.sub(r'\s+', ' ', part)
+                   for i, part in enumerate(parts))
+
+
+def parse_query(query):
+    """Return the parsed search query `query`.
+
+    :param str query: search query
+
+    :raises ValueError: if the query is invalid
+
+    Parsed queries, and parse errors, are kept in :data:`cache.queries_parsed`
+    by their normalized string (see :func:`normalize_query`).
+
+    """
+    key = normalize_query(query)
+    parsed = cache.queries_parsed.get(key)
+    if parsed is None:
+        from mtgcard import parser as _parser
+        try:
+            parsed = _parser.parser.parse(key)
+        except ValueError as e:
+            parsed = e
+        cache.queries_parsed.put(key, parsed)
+    if isinstance(parsed, ValueError):
+        raise ValueError(*parsed.args)
+    return parsed
+
+
+def find_cards(query, format=None, order='cmc', reverse=False):
+    """Return the cards matching `query` sorted by `order`, or None if none.
+
+    :param str  query:   search query
+    :param str  format:  format to search
+    :param str  order:   sort order (cmc, name, price, or setcode)
+    :param bool reverse: whether to reverse order
+
+    :raises ValueError: if the query is invalid
+
+    Results are kept in :data:`cache.queries` by their normalized formatted
+    query, so searching the same query again, in any order, does not query
+    the database.
+
+    """
+    fquery = normalize_query(format_query(query, format))
+    cached = cache.queries.get(fquery)
+    if cached is not None:
+        if (cached[0], cached[1]) != (order, reverse):
+            cached = (order, reverse, sort_cards(cached[2], order, reverse))
+            cache.queries.put(fquery, cached)
+        return cached[2]
+    pquery = parse_query(fquery)
+    db = database.interface()
+    cards = db.get_cards(pquery, sort=order, reverse=reverse)
+    if cards is not None:
+        cache.queries.put(fquery, (order, reverse, cards))
+    return cards
+
+
+class SearchResults:
+    """The matching cards of a search, rendered a page at a time.
+
+    :param list cards: matching cards
+    :param bool ansi:  whether color
+
+    """
+
+    def __init__(self, cards, ansi=True):
+        self.cards = cards
+        self.ansi = ansi
+        self.rendered = 0
+
+    def __len__(self):
+        return len(self.cards)
+
+    def done(self):
+        """Return whether all cards are rendered."""
+        return self.rendered >= len(self.cards)
+
+    def next_page(self, size=SEARCH_PAGE_SIZE):
+        """Render the next `size` cards and return their lines.
+
+        :param int size: number of cards (rounded up to full rows)
+
+        """
+        size = -(-size // CARDS_PER_ROW) * CARDS_PER_ROW
+        page = self.cards[self.rendered:self.rendered+size]
+        if not page:
+            return []
+        self.rendered += len(page)
+        from mtgcard import mtgcard as _mtgcard
+        return _mtgcard.list_cards_images(page, CARDS_PER_ROW,
+                image=False, ansi=self.ansi)
+
+    def first_pages(self, nlines):
+        """Render pages until there are at least `nlines` lines (or no more
+        cards) and return their lines."""
+        lines = []
+        while len(lines) < nlines and not self.done():
+            lines += self.next_page()
+        return lines
+
+
+def search_more(buf):
+    """Append the next page of search results to search buffer `buf`.
+
+    :param vim.buffer buf: search buffer
+
+    """
+    results = cache.searches.get(buf.number)
+    if results is None or results.done():
+        return
+    lines = results.next_page()
+    buf.options['modifiable'] = True
+    buf.options['readonly']   = False
+    buf.append(lines)
+    buf.options['modifiable'] = False
+    buf.options['readonly']   = True
+    buf.options['modified']   = False
+
+
 def search(buf, query, format=None, order='cmc', reverse=False, searchfile=None,
-        ansi=True):
+        ansi=True, background=False):
     """List card images in a split buffer or None on fail.
 
     :param vim.buffer buf:        deck buffer
     :param str        query:      search query
     :param str        format:     format to search
-    :param str        order:      sort order (cmc, name, or price)
+    :param str        order:      sort order (cmc, name, price, or setcode)
     :param bool       reverse:    whether to reverse order
     :param str        searchfile: search file path
     :param bool       ansi:       whether color
+    :param bool       background: whether to search on a worker thread
+
+    If `background`, the search window is opened at once and the search is
+    run by a :class:`worker.Job`, which is returned; its results are shown by
+    :func:`poll_search`.
 
     """
-    db = mtgcard.mtgdb.Interface()
     # add format if available
-    fquery = query
-    if format:
-        if query:
-            fquery = 'format:%s %s' % (format, fquery)
-        else:
-            fquery = 'format:%s' % (format,)
+    fquery = format_query(query, format)
+
+    # render only the first screenfuls; the rest is appended by search_more()
+    # as the cursor nears the end
+    nlines = 2 * int(vim.options['lines'])
 
     # get cards from query
-    try:
-        pquery = mtgcard.parser.parser.parse(fquery)
-    except ValueError as e:
-       print(e)
-       return None
-    cards = db.get_cards(pquery, sort=order, reverse=reverse)
-    if cards is None:
-        print( "no cards found" )
-        return None
-    card_list = mtgcard.mtgcard.list_cards_images(cards, 4, image=False, ansi=ansi)
+    if not background:
+        try:
+            cards = find_cards(query, format, order=order, reverse=reverse)
+        except ValueError as e:
+           print(e)
+           return None
+        if cards is None:
+            print( "no cards found" )
+            return None
+        results = SearchResults(cards, ansi=ansi)
+        card_list = results.first_pages(nlines)
 
     # create new search file if non supplied
     if searchfile is None:
@@ -244,9 +491,8 @@ def search(buf, query, format=None, order='cmc', reverse=False, searchfile=None,
         # vim.current.window.options['number'] = False
         # vim.current.window.options['wrap'] = False
 
-        vim.current.buffer[:] = card_list
-        vim.current.window.options['statusline'] = "{} matches ({})%=%p%%".format(
-                len(cards), fquery.strip())
+        vim.current.window.options['statusline'] = (
+                "%{mtg#search_status()}%=%p%%")
         # format END
 
         vim.current.buffer.options['buftype']    = 'nofile'
@@ -278,3 +524,99 @@ def search(buf, query, format=None, order='cmc', reverse=False, searchfile=None,
 
         vim.command(
                 'nnoremap <silent> <buffer> q <c-w>c')
+
+        vim.command('augroup mtg_search_buffer')
+        vim.command('autocmd! * <buffer>')
+        vim.command('autocmd CursorMoved <buffer> call mtg#search_more()')
+        vim.command("autocmd BufWipeout <buffer> "
+                    "call mtg#forget_buffer(expand('<abuf>'))")
+        vim.command('augroup END')
+
+        sbuf = vim.current.buffer
+        if background:
+            # drop the results of a search still running in this buffer
+            cache.searches.pop(sbuf.number, None)
+            show_results(sbuf, None, [], 'searching... ({})'.format(
+                         fquery.strip()))
+            job = worker.start(('search', sbuf.number), _find_and_render,
+                    query, format, order=order, reverse=reverse, ansi=ansi,
+                    nlines=nlines)
+            job.fquery = fquery
+            job.bufnr = sbuf.number
+            job.generation = next(_search_generation)
+            return job
+        show_results(sbuf, results, card_list, '{} matches ({})'.format(
+                     len(results), fquery.strip()))
+        return True
+
+
+def _find_and_render(job, query, format, order, reverse, ansi, nlines):
+    """Find the cards of a background search and render its first pages.
+
+    Return (:class:`SearchResults`, lines), or None if no cards match or the
+    job is cancelled.
+
+    """
+    cards = find_cards(query, format, order=order, reverse=reverse)
+    if cards is None or job.cancelled:
+        return None
+    results = SearchResults(cards, ansi=ansi)
+    return results, results.first_pages(nlines)
+
+
+def show_results(sbuf, results, lines, status):
+    """Show `lines` of search `results` in search buffer `sbuf`.
+
+    :param vim.buffer    sbuf:    search buffer
+    :param SearchResults results: search results (None if none)
+    :param list          lines:   rendered lines of `results`
+    :param str           status:  status (see mtg#search_status())
+
+    """
+    sbuf.options['modifiable'] = True
+    sbuf.options['readonly']   = False
+    sbuf[:] = lines
+    sbuf.options['modifiable'] = False
+    sbuf.options['readonly']   = True
+    sbuf.options['modified']   = False
+    if results is not None:
+        cache.searches[sbuf.number] = results
+    sbuf.vars['mtg_search_status'] = status
+
+
+def poll_search(bufnr, generation):
+    """Show the results of the background search of search buffer `bufnr`, if
+    it is done, and return whether it is done or superseded.
+
+    :param int bufnr:      search buffer number
+    :param int generation: generation of the job returned by :func:`search`
+
+    """
+    key = ('search', bufnr)
+    job = worker.jobs.get(key)
+    if job is None or job.generation != generation:
+        # a newer search was started in this buffer
+        return True
+    if not job.done():
+        return False
+    del worker.jobs[key]
+    if not int(vim.eval('bufexists({})'.format(bufnr))):
+        return True
+    sbuf = vim.buffers[bufnr]
+    fquery = job.fquery.strip()
+    try:
+        result = job.result()
+    except ValueError as e:
+        show_results(sbuf, None, [], '{} ({})'.format(e, fquery))
+        vim_warning(str(e))
+    except FileNotFoundError as e:
+        show_results(sbuf, None, [], 'no database ({})'.format(fquery))
+        vim_error("MTG database not found: run ':MTGUpdate'")
+    else:
+        if result is None:
+            show_results(sbuf, None, [], 'no cards found ({})'.format(fquery))
+        else:
+            results, lines = result
+            show_results(sbuf, results, lines, '{} matches ({})'.format(
+                         len(results), fquery))
+    return True
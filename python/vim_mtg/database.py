@@ -0,0 +1,76 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""The long-lived interface to the card database."""
+
+
+import threading
+import mtgcard.settings
+
+
+# one interface per thread, since database connections are not shared between
+# threads
+_local = threading.local()
+
+# incremented by :func:`close` to make every thread reopen its interface
+_generation = 0
+
+
+def interface():
+    """Return the card database interface, opening it on first use.
+
+    :raises FileNotFoundError: if the database does not exist
+
+    The interface is kept open for the rest of the session (per thread), until
+    :func:`close` is called.
+
+    """
+    db = getattr(_local, 'db', None)
+    if db is not None and _local.generation == _generation:
+        return db
+    _close(db)
+    _local.db = None
+    from mtgcard import mtgdb as _mtgdb
+    db = _mtgdb.Interface()
+    _local.db = db
+    _local.generation = _generation
+    return db
+
+
+def path():
+    """Return the path of the database file, or None if mtgcard does not
+    tell it (`mtgcard.settings.DB_PATH`)."""
+    return getattr(mtgcard.settings, 'DB_PATH', None)
+
+
+def close():
+    """Close the database interface.
+
+    Interfaces of other threads are closed on their next use. The database is
+    reopened lazily by :func:`interface` (e.g., after it is updated).
+
+    """
+    global _generation
+    _generation += 1
+    _close(getattr(_local, 'db', None))
+    _local.db = None
+
+
+def _close(db):
+    """Close the interface `db`, if it can be closed."""
+    close = getattr(db, 'close', None)
+    if close is not None:
+        close()
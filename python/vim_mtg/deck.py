@@ -18,16 +18,24 @@
 
 
 import re
-import mtgcard.mtgdb
-import mtgcard.colors
-import mtgcard.util
-
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from contextlib import nullcontext
+import mtgcard.settings
+
+from vim_mtg import cache
+from vim_mtg import database
+from vim_mtg import mana
+from vim_mtg import names
 from vim_mtg.vim_interface import vim_error, vim_warning, settings
 
 
 add_setcode = 0
 debug = 0
 
+# marks a key missing from the card cache (None is a cached unknown card)
+_MISSING = object()
+
 # formats
 SHOWN_FORMATS = mtgcard.settings.SHOWN_FORMATS
 
@@ -51,13 +59,289 @@ sections = {
         3: DECK_OTHER
         }
 
+# stats separator
+SEPARATOR = '----'
+
+# line kinds (besides section numbers, and -1 for the stats separator)
+LINE_CARD = 'card'
+LINE_BLANK = 'blank'
+LINE_TEXT = 'text'
+
+re_blank_ln = re.compile(r'^\s*$')
+# lines discarded from a deck without a warning (category headers, blank lines)
+re_category_ln = re.compile('^(?:Creatures|Planeswalkers|Instants'
+                            '|Sorceries|Enchantments|Artifacts|Lands|Other|$)')
+
+# a parsed card line
+CardLine = namedtuple('CardLine', ['count', 'name', 'setcode'])
+
+
+def line_kind(line):
+    """Return the kind of deck line `line`.
+
+    :param str line: a deck line
+
+    Return values:
+
+        1, 2, 3     section header (see `sections`), with or without a count
+        -1          stats separator
+        LINE_CARD   card line (see `re_card_ln`)
+        LINE_BLANK  blank line
+        LINE_TEXT   any other line
+
+    """
+    return _index_line(line)[0]
+
+
+def _index_line(line):
+    """Return (kind, CardLine or None) of deck line `line`."""
+    if line.startswith(SEPARATOR):
+        return (-1, None)
+    for section_nr, section_name in sections.items():
+        if line.startswith(section_name):
+            return (section_nr, None)
+    m = re_card_ln.match(line)
+    if m:
+        return (LINE_CARD, CardLine(int(m.group(1)), m.group(2), m.group(3)))
+    if re_blank_ln.match(line):
+        return (LINE_BLANK, None)
+    return (LINE_TEXT, None)
+
+
+def parse_card_line(line):
+    """Return a :class:`CardLine` of card line `line` or None if not a card.
+
+    :param str line: a deck line (e.g., '4 Shock')
+
+    """
+    m = re_card_ln.match(line)
+    if not m:
+        return None
+    return CardLine(int(m.group(1)), m.group(2), m.group(3))
+
+
+class DeckDocument:
+    """A list of deck lines with an index of its sections and card lines.
+
+    :param list blist: list containing deck sections (e.g., a buffer list)
+
+    The lines are indexed in one pass: the kind of each line (see
+    :func:`line_kind`), the parsed card lines, and the positions of the section
+    headers and stats separators. `blist` is edited in place through the
+    methods of the document, which update the index without rescanning the
+    other lines.
+
+    Example for `DeckDocument(b)`:
+
+        0 |Main 4       <-- header of section 1
+        1 |4 Shock      <-- CardLine(4, 'Shock', None)
+        2 |             <-- LINE_BLANK
+        3 |Sideboard    <-- header of section 2
+        4 |----         <-- stats separator (-1)
+
+    """
+
+    def __init__(self, blist):
+        self.lines = blist
+        index = [_index_line(l) for l in blist]
+        self.kinds = [k for (k, c) in index]
+        self.cards = [c for (k, c) in index]
+        self.headers = [i for (i, k) in enumerate(self.kinds)
+                        if not isinstance(k, str)]
+        self._ranges = None
+        self._line_sections = None
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __getitem__(self, index):
+        return self.lines[index]
+
+    def __setitem__(self, index, line):
+        if index < 0:
+            index += len(self.lines)
+        self.splice(index, index+1, [line])
+
+    def insert(self, index, line):
+        """Insert `line` before `index`."""
+        if index < 0:
+            index = max(index + len(self.lines), 0)
+        index = min(index, len(self.lines))
+        self.splice(index, index, [line])
+
+    def append(self, line):
+        """Append `line`."""
+        self.splice(len(self.lines), len(self.lines), [line])
+
+    def extend(self, lines):
+        """Append `lines`."""
+        self.splice(len(self.lines), len(self.lines), lines)
+
+    def pop(self, index=-1):
+        """Remove and return the line at `index`."""
+        if index < 0:
+            index += len(self.lines)
+        line = self.lines[index]
+        self.splice(index, index+1, [])
+        return line
+
+    def splice(self, start, stop, lines):
+        """Replace lines `start` to `stop` (exclusive) with `lines`.
+
+        :param int  start: first index to replace
+        :param int  stop:  index after the last index to replace
+        :param list lines: new lines
+
+        Only the new lines are indexed; the index of the other lines is
+        shifted.
+
+        """
+        lines = list(lines)
+        index = [_index_line(l) for l in lines]
+        kinds = [k for (k, c) in index]
+        cards = [c for (k, c) in index]
+        self.lines[start:stop] = lines
+        self.kinds[start:stop] = kinds
+        self.cards[start:stop] = cards
+        delta = len(lines) - (stop - start)
+        first = bisect_left(self.headers, start)
+        after = bisect_left(self.headers, stop)
+        self.headers[first:] = (
+                [start+i for (i, k) in enumerate(kinds)
+                 if not isinstance(k, str)]
+                + [h+delta for h in self.headers[after:]])
+        self._ranges = None
+        self._line_sections = None
+
+    def section_header(self, section_nr):
+        """Return the index of the header of section `section_nr` or None.
+
+        :param int section_nr: section number, or -1 for the stats separator
+
+        """
+        if self._ranges is None:
+            self._ranges = {}
+            for h in reversed(self.headers):
+                self._ranges[self.kinds[h]] = h
+        return self._ranges.get(section_nr)
+
+    def separator(self):
+        """Return the index of the first exact stats separator line or None."""
+        for h in self.headers:
+            if self.lines[h] == SEPARATOR:
+                return h
+        return None
+
+    def section_range(self, section_nr):
+        """Returns (firstline,lastline) of section `section_nr` or None.
+
+        :param int section_nr: section number
+        :raises ValueError:    if invalid section number
+
+        See :func:`find_section`.
+
+        """
+        if section_nr not in sections:
+            raise ValueError("invalid section number")
+        firstline = self.section_header(section_nr)
+        if firstline is None:
+            return None
+        lastline = len(self.lines)-1
+        for h in self.headers[bisect_right(self.headers, firstline):]:
+            kind = self.kinds[h]
+            if kind == -1 or kind > section_nr:
+                lastline = h-1
+                break
+        return (firstline, lastline)
+
+    def section_of(self, index):
+        """Return section number of line `index` or None if none.
+
+        :param int index:   line index
+        :raises ValueError: if the index is out of bounds
+
+        See :func:`get_section`.
+
+        """
+        if index < 0 or index > len(self.lines)-1:
+            raise ValueError("buffer list does not contain index")
+        if self._line_sections is None:
+            # section number of each line, until the document is edited
+            line_sections = [None] * len(self.lines)
+            for (i, h) in enumerate(self.headers):
+                end = (self.headers[i+1] if i+1 < len(self.headers)
+                       else len(self.lines))
+                line_sections[h:end] = [self.kinds[h]] * (end-h)
+            self._line_sections = line_sections
+        return self._line_sections[index]
+
+    def blanklines(self, firstline, lastline):
+        """Return number of blank lines at start and end of a line range.
+
+        :param int firstline: first line index
+        :param int lastline:  last line index
+
+        See :func:`surrounding_blanklines`.
+
+        """
+        kinds = self.kinds[firstline:lastline+1]
+        start_count = 0
+        for k in kinds:
+            if k != LINE_BLANK:
+                break
+            start_count += 1
+        end_count = 0
+        for k in reversed(kinds):
+            if k != LINE_BLANK:
+                break
+            end_count += 1
+        return (start_count, end_count)
+
+    def has_card_line(self):
+        """Return whether the document contains a card line."""
+        return LINE_CARD in self.kinds
+
+
+def document(blist):
+    """Return `blist` as a :class:`DeckDocument`.
+
+    :param list blist: list containing deck sections, or a `DeckDocument`
+
+    """
+    if isinstance(blist, DeckDocument):
+        return blist
+    return DeckDocument(blist)
+
+
+def buffer_document(buffer, changedtick):
+    """Return a :class:`DeckDocument` of the lines of vim buffer `buffer`.
+
+    :param vim.Buffer buffer:      a deck buffer
+    :param int        changedtick: `b:changedtick` of `buffer`
+
+    The document is kept in `cache.documents` and reused until the buffer
+    changes, so cursor queries (e.g., :func:`get_section`) do not index the
+    buffer again. It must not be edited.
+
+    """
+    entry = cache.documents.get(buffer.number)
+    if entry is not None and entry[0] == changedtick:
+        return entry[1]
+    doc = DeckDocument(buffer[:])
+    cache.documents[buffer.number] = (changedtick, doc)
+    return doc
+
 
 def find_section(blist, section_nr):
     """Returns (firstline,lastline) of deck section.
 
     From `start_line` to line before `end_pattern`.
 
-    :param list blist:   list containing deck sections (e.g., a buffer list)
+    :param list blist:   list containing deck sections (e.g., a buffer list,
+                         or a :class:`DeckDocument`)
     :param int  section: section number
     :raises ValueError:  if invalid section number
 
@@ -72,30 +356,7 @@ def find_section(blist, section_nr):
     returns (1, 3)
 
     """
-    try:
-        section_name = sections[section_nr]
-    except KeyError as e:
-        raise ValueError("invalid section number")
-    next_sections = list(sections.values())[section_nr:]
-    next_sections.append('----')
-    r_start = re.compile(r'^{}(?:{})?'.format(section_name, r_count))
-    r_end = r'^(?:{})(?:{})?'.format('|'.join(next_sections), r_count)
-
-    firstline = None
-    for i, l in enumerate(blist):
-        if r_start.match(l):
-            firstline = i
-            break
-    if firstline is None:
-        return None
-
-    lastline = len(blist)-1
-    for i, l in enumerate(blist[firstline+1:]):
-        if re.match(r_end, l):
-            lastline = firstline + i
-            break
-
-    return (firstline, lastline)
+    return document(blist).section_range(section_nr)
 
 
 def surrounding_blanklines(blist):
@@ -121,6 +382,241 @@ def surrounding_blanklines(blist):
     return (start_count, end_count)
 
 
+def card_key(name):
+    """Return the canonical key of card name `name`.
+
+    :param str name: name of card
+
+    Names are compared by this key (e.g., to combine lines of the same card).
+
+    """
+    return name.lower()
+
+
+def canonical_name(name):
+    """Return the canonical name of card `name`, or None if not a card.
+
+    :param str name: card name (e.g., 'shock')
+
+    The name is looked up in the name index (:data:`cache.names`), which is
+    loaded from the names file of all cards on first use (see
+    :func:`names.load_index`). The database is never queried: if there is no
+    names file yet, `name` is returned as typed.
+
+    """
+    if not names.load_index():
+        return name
+    return cache.names.get(card_key(name))
+
+
+def parse_deck_lines(deck_lines):
+    """Return a list of (line, match) for each line in `deck_lines`.
+
+    :param list deck_lines: list of 'count name' strings
+
+    `match` is the :data:`re_card_ln` match of `line`, or None if `line` is not
+    a card line.
+
+    """
+    return [(l, re_card_ln.match(l)) for l in deck_lines]
+
+
+def resolve_cards(keys, verbose=False):
+    """Return a dict of cards for a list of (name, setcode) keys.
+
+    :param list keys:    list of (name, setcode) tuples (setcode may be None)
+    :param int  verbose: whether to fetch legalities and price for cards
+
+    Cards are first looked up in the card cache (:data:`cache.cards`). The
+    remaining keys are resolved in one batch through the database interface
+    (:func:`database.interface`), and each distinct key is looked up only once.
+    Keys of the return value are (card_key(name), setcode); unknown cards are
+    mapped to None.
+
+    Example return value:
+
+        {
+            ('shock', None): Card,
+            ('pikachu', None): None,
+            ...
+        }
+
+    """
+    cards = {}
+    missing = []
+    for (name, setcode) in keys:
+        key = (card_key(name), setcode)
+        if key in cards:
+            continue
+        c = cache.cards.get(key + (bool(verbose),), _MISSING)
+        if c is _MISSING:
+            missing.append((name, setcode))
+            c = None
+        cards[key] = c
+
+    if missing:
+        db = database.interface()
+        for (name, setcode) in missing:
+            key = (card_key(name), setcode)
+            try:
+                if not setcode:
+                    c = db.get_card(name, verbose=verbose)
+                else:
+                    c = db.get_card(name, setcode, verbose=verbose)
+            except ValueError as e:
+                c = None
+            cache.cards.put(key + (bool(verbose),), c)
+            cards[key] = c
+
+    return cards
+
+
+def get_card(name, setcode=None, verbose=False):
+    """Return the card `name` (see :func:`resolve_cards`).
+
+    :param str  name:    name of card
+    :param str  setcode: set code of card
+    :param int  verbose: whether to fetch legalities and price for card
+    :raises ValueError:  if card not found
+
+    """
+    c = resolve_cards([(name, setcode)], verbose=verbose)[(card_key(name), setcode)]
+    if c is None:
+        raise ValueError("card not found")
+    return c
+
+
+# legalities of a card as bitmasks of SHOWN_FORMATS (see legality_masks)
+Legality = namedtuple('Legality', ['legal', 'restricted', 'banned'])
+
+# bitmask of all SHOWN_FORMATS
+ALL_FORMATS = (1 << len(SHOWN_FORMATS)) - 1
+
+# card type categories of a sectioned deck, in the order they are checked
+card_categories = [
+        ('Creature', 'Creatures'),
+        ('Land', 'Lands'),
+        ('Planeswalker', 'Planeswalkers'),
+        ('Instant', 'Instants'),
+        ('Sorcery', 'Sorceries'),
+        ('Enchantment', 'Enchantments'),
+        ('Artifact', 'Artifacts'),
+        ]
+
+
+def card_category(card):
+    """Return the type category of `card` (e.g., 'Creatures'), or 'Other'.
+
+    :param Card card: a card
+
+    """
+    card_type = card.type or ''
+    for (t, category) in card_categories:
+        if t in card_type:
+            return category
+    return 'Other'
+
+
+def legality_masks(card):
+    """Return the legalities of `card` as a :class:`Legality` of bitmasks.
+
+    :param Card card: a card
+
+    Bit `i` of each mask is set if the card has that status in format
+    `SHOWN_FORMATS[i]` (see :func:`format_names`).
+
+    """
+    formats = card.formats or {}
+    masks = {'Legal': 0, 'Restricted': 0, 'Banned': 0}
+    for (i, f) in enumerate(SHOWN_FORMATS):
+        status = formats.get(f)
+        if status in masks:
+            masks[status] |= 1 << i
+    return Legality(masks['Legal'], masks['Restricted'], masks['Banned'])
+
+
+def format_names(mask):
+    """Return the set of formats of bitmask `mask` (see :func:`legality_masks`).
+
+    :param int mask: a bitmask of formats
+
+    """
+    return {f for (i, f) in enumerate(SHOWN_FORMATS) if mask >> i & 1}
+
+
+class DeckEntry:
+    """A deck card: a card, its count, and fields derived from the card.
+
+    :param Card card:  a card
+    :param int  count: how many of the card
+
+    The derived fields are computed once, for sorting, formatting, and
+    :class:`DeckStats`:
+
+        cmc         converted mana cost bucket (0 to 6, for 6+)
+        category    type category (see :func:`card_category`)
+        is_land     whether the card has the type Land
+        mana        parsed manacost (see :func:`mana.parse`)
+        legal       formats the card is legal in (see :func:`legality_masks`)
+        restricted  formats the card is restricted in
+        banned      formats the card is banned in
+
+    An entry can also be used as a {'card': Card, 'count': COUNT} dict.
+
+    """
+
+    __slots__ = ('card', 'count', 'cmc', 'category', 'is_land', 'mana',
+                 'legal', 'restricted', 'banned')
+
+    def __init__(self, card, count):
+        self.card = card
+        self.count = count
+        self.cmc = min(int(card.cmc or 0), 6)
+        self.category = card_category(card)
+        self.is_land = 'Land' in (card.types or [])
+        self.mana = mana.parse(card.manacost)
+        (self.legal, self.restricted, self.banned) = legality_masks(card)
+
+    def __getitem__(self, key):
+        if key not in ('card', 'count'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key != 'count':
+            raise KeyError(key)
+        self.count = value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError as e:
+            return default
+
+    def __eq__(self, other):
+        try:
+            return (self.card, self.count) == (other['card'], other['count'])
+        except (KeyError, TypeError) as e:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "DeckEntry({!r}, {!r})".format(self.card, self.count)
+
+
+def deck_entry(dcard):
+    """Return deck card `dcard` as a :class:`DeckEntry`.
+
+    :param dict dcard: a deck card as {'card': Card, 'count': COUNT}, or a
+                       `DeckEntry`
+
+    """
+    if isinstance(dcard, DeckEntry):
+        return dcard
+    return DeckEntry(dcard['card'], dcard['count'])
+
+
 def get_deck(deck_lines, verbose=False, warnings=True):
     """Return a deck (as below) from a list of 'count name' lines.
 
@@ -128,54 +624,72 @@ def get_deck(deck_lines, verbose=False, warnings=True):
     :param int  verbose:    whether to fetch legalities and price for cards
     :param int  warnings:   whether to display warnings for invalid lines
 
+    Cards of all lines are resolved in one batch (see :func:`resolve_cards`).
+    Lines of the same card are combined (see :func:`card_key`), in the order the
+    card is first seen.
+
     Example return value:
 
         [
-           {   'card': Card,
-               'count': 4
-           },
-           {   'card': Card,
-               'count': 3
-           },
+           DeckEntry(Card, 4),
+           DeckEntry(Card, 3),
            ...
         ]
 
+    The entries may be used as {'card': Card, 'count': COUNT} dicts (see
+    :class:`DeckEntry`).
+
     """
-    db = mtgcard.mtgdb.Interface()
+    (deck, invalid) = _get_deck(deck_lines, verbose=verbose)
+    if warnings:
+        for l in invalid:
+            vim_warning("invalid line discarded: '{}'".format(l))
+    return deck
+
+
+def _get_deck(deck_lines, verbose=False, resolved=None):
+    """Return (deck, invalid lines) from a list of 'count name' lines.
+
+    :param list deck_lines: list of 'count name' strings
+    :param int  verbose:    whether to fetch legalities and price for cards
+    :param dict resolved:   cards already resolved (see :func:`resolve_cards`);
+                            updated with the cards of `deck_lines`
+
+    See :func:`get_deck`.
+
+    """
+    parsed = parse_deck_lines(deck_lines)
+    keys = [(m.group(2), m.group(3)) for (l, m) in parsed if m]
+    if resolved is None:
+        resolved = {}
+    missing = [k for k in keys if (card_key(k[0]), k[1]) not in resolved]
+    if missing:
+        resolved.update(resolve_cards(missing, verbose=verbose))
+
     deck = []
-    for l in deck_lines:
-        m = re_card_ln.match(l)
+    invalid = []
+    index = {}
+    for (l, m) in parsed:
         if not m:
-            if warnings:
-                if not re.match('^(?:Creatures|Planeswalkers|Instants'
-                        '|Sorceries|Enchantments|Artifacts|Lands|Other|$)', l):
-                    vim_warning("invalid line discarded: '{}'".format(l))
+            if not re_category_ln.match(l):
+                invalid.append(l)
             continue
         count = int(m.group(1))
         name = m.group(2)
         setcode = m.group(3)
-        try:
-            if not setcode:
-                c = db.get_card(name, verbose=verbose)
-            else:
-                c = db.get_card(name, setcode, verbose=verbose)
-            if c.types[0] == 'Token':
-                raise ValueError
-        except ValueError as e:
-            if warnings:
-                vim_warning("invalid line discarded: '{}'".format(l))
+        c = resolved[(card_key(name), setcode)]
+        if c is None or c.types[0] == 'Token':
+            invalid.append(l)
             continue
         # if already in deck, combine
-        found = False
-        for i, e in enumerate(deck):
-            if e['card'].name.lower() == name.lower():
-                deck[i]['count'] += count
-                found = True
-                break
-        if not found:
-            deck.append( {'count': count, 'card': c} )
+        key = card_key(c.name)
+        if key in index:
+            index[key].count += count
+        else:
+            index[key] = DeckEntry(c, count)
+            deck.append(index[key])
 
-    return deck
+    return (deck, invalid)
 
 
 def total_cards(deck):
@@ -200,14 +714,7 @@ def mana_curve(deck):
         [0cmc, 1cmc, 2cmc, 3cmc, 4cmc, 5cmc, 6+cmc]
 
     """
-    curve = [0,0,0,0,0,0,0]
-    for c in deck:
-        cost = int(c['card'].cmc)
-        if cost > 6: cost = 6
-        count = c['count']
-        curve[cost] = curve[cost] + count
-
-    return curve
+    return DeckStats(deck).mana_curve()
 
 
 def print_mana_curve(curve):
@@ -233,7 +740,8 @@ def print_mana_curve(curve):
 def card_line_print(dcard, lname=None, lmana=None, add_setcode=False, ansi=True):
     """Return a formatted card line.
 
-    :param dict dcard:       a deck card as {'card': Card, 'count': COUNT}
+    :param dict dcard:       a deck card as {'card': Card, 'count': COUNT} (or
+                             a :class:`DeckEntry`)
     :param int  lname:       length of name
     :param int  lmana:       length of manacost
     :param bool add_setcode: whether to add set code for each card
@@ -248,15 +756,13 @@ def card_line_print(dcard, lname=None, lmana=None, add_setcode=False, ansi=True)
         else:
             line = '{:d} {:s}'.format(dcard['count'], dcard['card'].name)
     else:
-        mana = dcard['card'].manacost
-        if mana is not None:
-            if ansi:
-                mana = mtgcard.colors.colorize_mana(mana, 0)[0]
+        if ansi:
+            mana_print = deck_entry(dcard).mana.ansi
         else:
-            mana = ''
+            mana_print = dcard['card'].manacost or ''
         line = "{:<3d}{:{lname}s}{:{lmana}s}".format(dcard['count'],
                                                      dcard['card'].name,
-                                                     mana,
+                                                     mana_print,
                                                      lname=lname+2,
                                                      lmana=lmana).strip()
     return line
@@ -272,34 +778,28 @@ def std_deck(deck, add_setcode=False, mana=False, ansi=True):
 
     """
     # sort deck by cmc, name
-    deck = sorted(deck, key=lambda c: c['card'].name)
-    deck = sorted(deck, key=lambda c: c['card'].cmc)
+    deck = sorted((deck_entry(c) for c in deck),
+                  key=lambda c: (c.card.cmc, c.card.name))
 
     # create new deck lines sorted by cmc, with 0 cmc last
     formatted_lines = []
     append = []
     if mana:
         # column widths
-        lname = max([len(c['card'].name) for c in deck]) if deck else 0
+        lname = max([len(c.card.name) for c in deck]) if deck else 0
         lmana = 15
         for c in deck:
-            if 'Land' in c['card'].types:
+            if c.is_land:
                 append.append(card_line_print(c, lname, lmana, ansi=ansi))
             else:
                 formatted_lines.append(card_line_print(c, lname, lmana,
                     ansi=ansi))
     else:
         for c in deck:
-            if add_setcode:
-                if 'Land' in c['card'].types:
-                    append.append(card_line_print(c))
-                else:
-                    formatted_lines.append(card_line_print(c))
+            if c.is_land:
+                append.append(card_line_print(c))
             else:
-                if 'Land' in c['card'].types:
-                    append.append(card_line_print(c))
-                else:
-                    formatted_lines.append(card_line_print(c))
+                formatted_lines.append(card_line_print(c))
     formatted_lines = formatted_lines + append
     return formatted_lines
 
@@ -315,49 +815,20 @@ def sectioned_deck(deck, add_setcode=False, ansi=True):
     """
     if deck == []: return []
     # sort deck by cmc, name
-    deck = sorted(deck, key=lambda c: c['card'].name)
-    deck = sorted(deck, key=lambda c: c['card'].cmc)
-
-    creatures     = []
-    planeswalkers = []
-    instants      = []
-    sorceries     = []
-    enchantments  = []
-    artifacts     = []
-    lands         = []
-    other         = []
+    deck = sorted((deck_entry(c) for c in deck),
+                  key=lambda c: (c.card.cmc, c.card.name))
 
-    for c in deck:
-        if 'Creature' in c['card'].type:
-            creatures.append(c)
-        elif 'Land' in c['card'].type:
-            lands.append(c)
-        elif 'Planeswalker' in c['card'].type:
-            planeswalkers.append(c)
-        elif 'Instant' in c['card'].type:
-            instants.append(c)
-        elif 'Sorcery' in c['card'].type:
-            sorceries.append(c)
-        elif 'Enchantment' in c['card'].type:
-            enchantments.append(c)
-        elif 'Artifact' in c['card'].type:
-            artifacts.append(c)
-        else:
-            if debug:
-                raise AssertionError('did not find a section for card: %s'
-                        %(c['card'].name,))
-            else:
-                other.append(c)
+    categories = {category: [] for (t, category) in card_categories}
+    categories['Other'] = []
 
-    if len(deck) != len(creatures)+len(planeswalkers)+len(instants)+ \
-                    len(sorceries)+len(enchantments)+len(artifacts)+len(lands):
-        names = [c['card'].name for c in deck]
-        if debug:
-            raise AssertionError('did not find a section for some cards: %s'
-                    % (names,))
+    for c in deck:
+        if debug and c.category == 'Other':
+            raise AssertionError('did not find a section for card: %s'
+                    %(c.card.name,))
+        categories[c.category].append(c)
 
     # column widths
-    lname = max([len(c['card'].name) for c in deck])
+    lname = max([len(c.card.name) for c in deck])
     lmana = 15
 
     # create new deck lines sorted by cmc, with lands last
@@ -377,14 +848,9 @@ def sectioned_deck(deck, add_setcode=False, ansi=True):
                 lines.append(card_line_print(c, lname, lmana, ansi=ansi))
             lines.append('')
 
-    append_sec(creatures, "Creatures")
-    append_sec(planeswalkers, "Planeswalkers")
-    append_sec(instants, "Instants")
-    append_sec(sorceries, "Sorceries")
-    append_sec(enchantments, "Enchantments")
-    append_sec(artifacts, "Artifacts")
-    append_sec(lands, "Lands")
-    append_sec(other, "Other")
+    for s in ["Creatures", "Planeswalkers", "Instants", "Sorceries",
+              "Enchantments", "Artifacts", "Lands", "Other"]:
+        append_sec(categories[s], s)
 
     lines.pop()
 
@@ -411,44 +877,50 @@ def add_section(blist, section_nr):
         section_name = sections[section_nr]
     except KeyError as e:
         raise ValueError("invalid section number")
-    next_sections = list(sections.values())[section_nr:]
-    next_sections.append('----')
-    r_start = re.compile(r'^{}(?:{})?'.format(section_name, r_count))
-    r_end = r'^(?:{})(?:{})?'.format('|'.join(next_sections), r_count)
+    doc = document(blist)
 
     # find (1) list index of next section or (2) last list index
     i_next = None
-    for i, l in enumerate(blist):
-        if re.match(r_start, l):
+    for h in doc.headers:
+        kind = doc.kinds[h]
+        if kind == section_nr:
             return blist
-        if re.match(r_end, l):
-            i_next = i
+        if kind == -1 or kind > section_nr:
+            i_next = h
             break
 
     if i_next == None:
-        if blist == ['']:
-            blist[0] = section_name
+        if doc.lines == ['']:
+            doc[0] = section_name
         else:
-            blist.append(section_name)
+            doc.append(section_name)
     else:
         # if main_sectioned:
         #     blist.insert(i_next, '')
         # blist.insert(i_next, '')
-        blist.insert(i_next, section_name)
+        doc.insert(i_next, section_name)
 
     return blist
 
 
-def add_to_section(blist, name, count, section_nr):
+def add_to_section(blist, name, count, section_nr, state=None):
     """Add '`count` `name`' to section number `section_nr` in deck.
 
-    :param list blist:      list containing deck sections (e.g., a buffer list)
-    :param str  name:       name of card to add
-    :param int  count:      how many `name`s to add
-    :param int  section_nr: section number
+    :param list         blist:      list containing deck sections (e.g., a
+                                    buffer list)
+    :param str          name:       name of card to add
+    :param int          count:      how many `name`s to add
+    :param int          section_nr: section number
+    :param ProcessState state:      state of the last run of
+                                    :func:`process_deck` on `blist`, to update
+                                    its stats section
 
     If section `section_nr` is not found. That section is created first.
 
+    If `state` is given and the card is added to the Main section, the stats
+    section is updated (see :meth:`ProcessState.update_stats`); the card is
+    fetched from the database if the last run did not resolve it.
+
     Sections:
 
         1   Main
@@ -458,17 +930,26 @@ def add_to_section(blist, name, count, section_nr):
     """
     if not count: count = 1
     line = "{} {}".format(count, name)
-    sec_lines = find_section(blist, section_nr)
+    doc = document(blist)
+    sec_lines = doc.section_range(section_nr)
     if sec_lines is not None:
         (firstline, lastline) = sec_lines
-        (start_bl, end_bl) = surrounding_blanklines(blist[firstline:lastline+1])
         # first_card_line = firstline+start_bl
         first_card_line = firstline
-        blist.insert(first_card_line+1, line)
+        doc.insert(first_card_line+1, line)
     else:
         # add_section(blist, section_nr, main_sectioned=main_sectioned)
-        add_section(blist, section_nr)
-        add_to_section(blist, name, count, section_nr)
+        add_section(doc, section_nr)
+        add_to_section(doc, name, count, section_nr)
+
+    if state is not None and section_nr == 1:
+        c = state.card(name)
+        if c is None:
+            try:
+                c = get_card(name, verbose=True)
+            except (ValueError, FileNotFoundError) as e:
+                c = None
+        _update_stats(state, doc, c, added=count)
 
     return blist
 
@@ -476,40 +957,35 @@ def add_to_section(blist, name, count, section_nr):
 def get_section(blist, index):
     """Return section number of line `index` or None if none.
 
-    :param list blist:  list containing deck sections (e.g., a buffer list)
+    :param list blist:  list containing deck sections (e.g., a buffer list,
+                        or a :class:`DeckDocument`)
     :param int  index:  element index in `blist`
     :raises ValueError: if the index is out of bounds of `blist`
 
     Section number -1 refers to auto generated stats section.
 
     """
-    if index < 0 or index > len(blist)-1:
-        raise ValueError("buffer list does not contain index")
-    sec_list = list(sections.values())+['----']
-    r_section = re.compile(r'^({})(?:{})?'.format('|'.join(sec_list), r_count))
-    section_nr = None
-    i = index
-    while i >= 0:
-        match = r_section.match(blist[i])
-        if match:
-            section_name = match.group(1)
-            if section_name == '----':
-                return -1
-            keys = list(sections.keys())
-            values = list(sections.values())
-            section_nr = keys[values.index(section_name)]
-            break
-        i -= 1
-    return section_nr
+    return document(blist).section_of(index)
 
 
-def move_card(blist, index, section_nr, count=None):
+def move_card(blist, index, section_nr, count=None, state=None):
     """Move deck line `index` to section number `section_nr`.
 
-    :param list blist:      list containing deck sections (e.g., a buffer list)
-    :param int  index:      element index in `blist`
-    :param int  section_nr: section number
-    :param int  count:      how many `name`s to move
+    :param list         blist:      list containing deck sections (e.g., a
+                                    buffer list)
+    :param int          index:      element index in `blist`
+    :param int          section_nr: section number
+    :param int          count:      how many `name`s to move
+    :param ProcessState state:      state of the last run of
+                                    :func:`process_deck` on `blist`, to update
+                                    its stats section
+
+    The count and name are parsed from the line text, and the name is
+    canonicalized with :func:`canonical_name` (no database lookup).
+
+    If `state` is given and the card is moved in or out of the Main section,
+    the stats section is updated (see :meth:`ProcessState.update_stats`) with
+    the card resolved by the last run.
 
     Sections:
 
@@ -518,7 +994,8 @@ def move_card(blist, index, section_nr, count=None):
         3   Other
 
     """
-    cur_section = get_section(blist, index)
+    doc = document(blist)
+    cur_section = doc.section_of(index)
 
     if cur_section == -1:
         return blist
@@ -526,35 +1003,69 @@ def move_card(blist, index, section_nr, count=None):
     if cur_section == section_nr:
         return blist
 
-    line = blist[index]
-    card = get_deck([line])
-
-    if card == []:
+    line = doc[index]
+    card = doc.cards[index]
+    if card is None:
         return blist
-    blist.pop(index)
+    name = canonical_name(card.name)
+    if name is None:
+        return blist
+    doc.pop(index)
 
     if count is None:
-        count = card[0]['count']
+        count = card.count
 
     # update source line
-    i_count = card[0]['count']-count
-    name = card[0]['card'].name
+    i_count = card.count-count
     if i_count > 0:
         # updated_line = re.sub('^\d+', '%-2s'%(i_count,), line)
         updated_line = re.sub('^\d+', '%s'%(i_count,), line)
-        blist.insert(index, updated_line)
+        doc.insert(index, updated_line)
+
+    add_to_section(doc, name, count, section_nr)
 
-    add_to_section(blist, name, count, section_nr)
+    if state is not None and section_nr == 1:
+        _update_stats(state, doc, state.card(name, card.setcode),
+                      added=count or 1)
+    elif state is not None and cur_section == 1:
+        _update_stats(state, doc, state.card(name, card.setcode),
+                      removed=count)
 
     return blist
 
 
+def _update_stats(state, doc, card, added=0, removed=0):
+    """Update the stats section of `doc` with `added` or `removed` copies of
+    `card` in the Main section (see :meth:`ProcessState.update_stats`).
+
+    If `card` is not known (None), the stats section is not updated again
+    until the next run of :func:`process_deck`.
+
+    """
+    if card is None:
+        state.stats_lines = None
+        return
+    if added:
+        state.update_stats(doc, added=[{'card': card, 'count': added}])
+    if removed:
+        state.update_stats(doc, removed=[{'card': card, 'count': removed}])
+
+
 def move_cards(blist, indexes, section_nr):
     """Move deck lines `indexes` to section number `section_nr`.
 
     :param list blist:      list containing deck sections (e.g., a buffer list)
     :param list indexes:    list of indexes in `blist`
     :param int  section_nr: section number
+    :raises ValueError:     if an index is out of bounds of `blist`
+
+    Return a new list. The card lines are parsed from the line text, and the
+    names are canonicalized with :func:`canonical_name` (no database lookup).
+    The selected lines of each section are removed, and their cards are added
+    at the top of section `section_nr`: lines of the same card are combined,
+    in the order the card is last seen. Lines of unknown cards and other text
+    lines are discarded with a warning. Section headers, and lines already in
+    section `section_nr` or in the stats section are kept.
 
     Sections:
 
@@ -563,68 +1074,72 @@ def move_cards(blist, indexes, section_nr):
         3   Other
 
     """
-    sec_m_range = None
-    sec_s_range = None
-    sec_o_range = None
-    current_range = None
-    ranges = []
-    i_in_range = []
+    doc = document(blist)
 
-    # for each index, add it to a section
+    # group the selected lines by section range
+    groups = [[]]
+    current_range = None
     for i in indexes:
+        if current_range is not None and not (
+                current_range[0] <= i <= current_range[1]):
+            # range complete
+            groups.append([])
+            current_range = None
+        if current_range is None:
+            cur_section = doc.section_of(i)
+            if cur_section == -1:
+                continue
+            if cur_section == section_nr:
+                # discard index if it is already in target section
+                continue
+            if cur_section is not None:
+                (firstline, lastline) = doc.section_range(cur_section)
+                current_range = (firstline, lastline)
+                if i == firstline:
+                    # skip section headers
+                    continue
+                if firstline == lastline:
+                    current_range = None
+                    continue
+                current_range = (firstline+1, lastline)
+        groups[-1].append(i)
+
+    # combine the cards of each group
+    removed = set()
+    moved = []
+    for group in reversed(groups):
+        cards = {}
+        for i in reversed(group):
+            removed.add(i)
+            card = doc.cards[i]
+            if card is None:
+                if not re_category_ln.match(doc[i]):
+                    vim_warning("invalid line discarded: '{}'".format(doc[i]))
+                continue
+            name = canonical_name(card.name)
+            if name is None:
+                vim_warning("invalid line discarded: '{}'".format(doc[i]))
+                continue
+            key = card_key(name)
+            if key in cards:
+                cards[key][0] += card.count
+            else:
+                cards[key] = [card.count, name]
+        moved[:0] = reversed(list(cards.values()))
 
-        # if i is not in current section, loop until element is inserted
-        while True:
-            if current_range is None:
-                # new section range
-                cur_section = get_section(blist, i)
-                if cur_section == -1:
-                    break
-                if cur_section is not None:
-                    sec_name = sections[cur_section]
-                    if cur_section == section_nr:
-                        # discard index if it is already in target section
-                        current_range = None
-                        break
-                    # note: starts on header
-                    current_range = find_section(blist, cur_section)
-                    cur_range_s = current_range[0]
-                    cur_range_e = current_range[1]
-                    if i == cur_range_s:
-                        # skip section headers
-                        break
-                    if cur_range_s == cur_range_e:
-                        # discard index it is an empty section
-                        current_range = None
-                        break
-                    cur_range_s += 1
-                else:
-                    # not in section
-                    sec_name = "None"
-                    cur_range_s = i
-                    cur_range_e = i
+    # rebuild the deck once; removed lines are kept as '\0' until the
+    # section is added, so that it is placed as with the lines in the deck
+    doc = DeckDocument(['\0' if i in removed else l
+                        for (i, l) in enumerate(doc)])
+    if moved:
+        if doc.section_header(section_nr) is None:
+            add_section(doc, section_nr)
+        first_card_line = doc.section_header(section_nr)+1
+        doc.splice(first_card_line, first_card_line,
+                   ["{} {}".format(count or 1, name)
+                    for (count, name) in moved])
 
-            if i >= cur_range_s and i <= cur_range_e:
-                i_in_range.insert(0, i)
-                break
-            else:
-                ranges.append(i_in_range)
-                # range complete; iterate to find section of i
-                current_range = None
-                i_in_range = []
-    ranges.append(i_in_range)
-    ranges = [r for r in ranges if r != []]
-
-    ranges.reverse()
-    for i_list in ranges:
-        subdeck = get_deck([blist[i] for i in i_list])
-        for i in i_list:
-            blist[i] = '\0'
-        for c in subdeck:
-            add_to_section(blist, c['card'].name, c['count'], section_nr)
-
-    blist = [l for l in blist if l != '\0']
-    return blist
+    return [l for l in doc if l != '\0']
 
 
 def legal_formats(deck):
@@ -637,14 +1152,61 @@ def legal_formats(deck):
         {'standard', 'vintage'}
 
     """
-    if len(deck) == 0: return set()
-    legal_fmts = set(SHOWN_FORMATS)
+    return format_names(legal_mask(deck))
+
+
+def legal_mask(deck):
+    """Return the formats deck `deck` is legal in as a bitmask.
+
+    :param list deck: a deck as [{'card': Card, 'count': COUNT}, ...]
+
+    The legal masks of the cards (see :func:`legality_masks`) are combined with
+    a bitwise AND, so decks can be validated without building sets.
+
+    """
+    if len(deck) == 0: return 0
+    mask = ALL_FORMATS
+    for c in deck:
+        mask &= deck_entry(c).legal
+    return mask
+
+
+def format_breakers(deck):
+    """Return the cards that are not legal in each format.
+
+    :param list deck: a deck as [{'card': Card, 'count': COUNT}, ...]
+
+    Example return value:
+
+        {'standard': ['Sol Ring'], 'vintage': ['Sol Ring'], ...}
+
+    Formats the whole deck is legal in are not included.
+
+    """
+    breakers = {}
     for c in deck:
-        cur = c['card'].formats
-        if cur == None: cur = {}
-        cur_fmts = {f for f in cur.keys() if cur[f] == 'Legal'}
-        legal_fmts = legal_fmts & cur_fmts
-    return legal_fmts
+        entry = deck_entry(c)
+        for f in format_names(ALL_FORMATS & ~entry.legal):
+            breakers.setdefault(f, []).append(entry.card.name)
+    return breakers
+
+
+def restricted_counts(deck):
+    """Return the number of restricted cards in each format.
+
+    :param list deck: a deck as [{'card': Card, 'count': COUNT}, ...]
+
+    Example return value:
+
+        {'vintage': 2}
+
+    """
+    counts = {}
+    for c in deck:
+        entry = deck_entry(c)
+        for f in format_names(entry.restricted):
+            counts[f] = counts.get(f, 0) + entry.count
+    return counts
 
 
 def legal_formats_print(legal_fmts):
@@ -653,8 +1215,9 @@ def legal_formats_print(legal_fmts):
     :param set legal_fmts: formats that are legal as {'FORMAT', ...}
 
     """
+    from mtgcard import util as _util
     deck_fmts = {f: 'Legal' for f in legal_fmts}
-    fmts_print = mtgcard.util.legality_print(deck_fmts, ansi=False)
+    fmts_print = _util.legality_print(deck_fmts, ansi=False)
     return fmts_print
 
 
@@ -668,21 +1231,7 @@ def devotion(deck):
         {'W': 1, 'R': 1}
 
     """
-    colors = {'W': 0, 'U': 0, 'B': 0, 'R': 0, 'G': 0, 'S': 0, 'C': 0}
-
-    for c in deck:
-        manacost = c['card'].manacost
-        if manacost is None:
-            continue
-        match = re.findall('([WUBRGSC])(?:/([WUBRGSC]))?', manacost)
-        if match:
-            for t in match:
-                for color in t:
-                    if color:
-                        colors[color] += 1 * c['count']
-    colors = {k: v for k, v in colors.items() if v > 0}
-
-    return colors
+    return DeckStats(deck).devotion()
 
 
 def devotion_print(devotion):
@@ -709,45 +1258,380 @@ def deck_stats(deck):
     :param list deck: a deck as [{'card': Card, 'count': COUNT}, ...]
 
     """
-    cmc = 0
-    nonlands = 0
-    lands = 0
-    for c in deck:
-        cost = int(c['card'].cmc)
-        if cost > 6: cost = 6
-        cmc += c['count'] * cost
-        if c['card'].types[0] != 'Land':
-            nonlands += c['count']
+    return DeckStats(deck).stats()
+
+
+class DeckStats:
+    """The statistics of a deck, accumulated in one pass over its cards.
+
+    :param list deck: a deck as [{'card': Card, 'count': COUNT}, ...]
+
+    The card count, mana curve, devotion, legal formats, and land counts are
+    kept up to date as deck cards are added with :meth:`add` and removed with
+    :meth:`remove`, without walking the deck again.
+
+    Example:
+
+        stats = DeckStats(deck)
+        stats.remove({'card': shock, 'count': 2})
+        print_mana_curve(stats.mana_curve())
+
+    """
+
+    def __init__(self, deck=()):
+        self.total = 0
+        self.curve = [0,0,0,0,0,0,0]
+        self.cmc = 0
+        self.lands = 0
+        self.nonlands = 0
+        self.colors = {'W': 0, 'U': 0, 'B': 0, 'R': 0, 'G': 0, 'S': 0, 'C': 0}
+        # count of each distinct card, by :func:`card_key` of its name
+        self.cards = {}
+        self.legal = [0] * len(SHOWN_FORMATS)
+        for c in deck:
+            self.add(c)
+
+    def add(self, dcard):
+        """Add deck card `dcard` (as {'card': Card, 'count': COUNT})."""
+        self._update(dcard, 1)
+
+    def remove(self, dcard):
+        """Remove deck card `dcard`, previously added with :meth:`add`.
+
+        The count of `dcard` may be less than the added count (e.g., when one
+        of the card lines is removed); the card is removed from the legal
+        formats once none are left.
+
+        """
+        self._update(dcard, -1)
+
+    def copy(self):
+        """Return a copy of the stats, updated independently."""
+        stats = DeckStats()
+        stats.total = self.total
+        stats.curve = list(self.curve)
+        stats.cmc = self.cmc
+        stats.lands = self.lands
+        stats.nonlands = self.nonlands
+        stats.colors = dict(self.colors)
+        stats.cards = dict(self.cards)
+        stats.legal = list(self.legal)
+        return stats
+
+    def _update(self, dcard, sign):
+        entry = deck_entry(dcard)
+        card = entry.card
+        count = sign * entry.count
+        self.total += count
+
+        # mana curve and cmc (6+ counted as 6)
+        self.curve[entry.cmc] += count
+        self.cmc += count * entry.cmc
+        if card.types and card.types[0] == 'Land':
+            self.lands += count
+        else:
+            self.nonlands += count
+
+        # devotion
+        for (color, n) in entry.mana.pips:
+            self.colors[color] += n * count
+
+        # legal formats (of every distinct deck card, regardless of count)
+        key = card_key(card.name) if card.name else id(card)
+        if sign > 0:
+            if key in self.cards:
+                self.cards[key] += entry.count
+                return
+            self.cards[key] = entry.count
         else:
-            lands += c['count']
-    return {
-        "cmc": cmc,
-        "avg_cmc": cmc / nonlands if nonlands > 0 else 0,
-        "lands": lands,
-        "nonlands": nonlands,
-    }
+            if key not in self.cards:
+                return
+            self.cards[key] -= entry.count
+            if self.cards[key] > 0:
+                return
+            del self.cards[key]
+        for i in range(len(self.legal)):
+            if entry.legal >> i & 1:
+                self.legal[i] += sign
+
+    def mana_curve(self):
+        """Return the mana curve (see :func:`mana_curve`)."""
+        return list(self.curve)
+
+    def devotion(self):
+        """Return the devotion (see :func:`devotion`)."""
+        return {k: v for k, v in self.colors.items() if v > 0}
+
+    def legal_formats(self):
+        """Return the legal formats (see :func:`legal_formats`)."""
+        if not self.cards: return set()
+        return format_names(self.legal_mask())
+
+    def legal_mask(self):
+        """Return the legal formats as a bitmask (see :func:`legal_mask`)."""
+        if not self.cards: return 0
+        mask = 0
+        for (i, n) in enumerate(self.legal):
+            if n == len(self.cards):
+                mask |= 1 << i
+        return mask
+
+    def stats(self):
+        """Return cmc, avg_cmc, land count, and non-land count (see
+        :func:`deck_stats`)."""
+        return {
+            "cmc": self.cmc,
+            "avg_cmc": self.cmc / self.nonlands if self.nonlands > 0 else 0,
+            "lands": self.lands,
+            "nonlands": self.nonlands,
+        }
+
+
+def stats_lines(stats, counts=None):
+    """Return the lines of the stats section of a deck (after the separator).
+
+    :param DeckStats stats:  stats of the Main section
+    :param bool      counts: whether to add card counts, mana, devotion, and
+                             legalities (default: whether there are cards)
+
+    """
+    if counts is None:
+        counts = bool(stats.cards)
+    lines = []
 
+    # add mana curve
+    lines.append('')
+    lines.append('mana curve:')
+    lines.extend(['  '+l for l in print_mana_curve(stats.mana_curve())])
+    lines.append('')
+
+    if counts:
+        s = stats.stats()
+        # card counts
+        lines.append('cards:')
+        lines.append('  total: {:d}'.format( stats.total ))
+        lines.append('  non-lands: {:d}'.format( s['nonlands'] ))
+        lines.append('  lands: {:d}'.format( s['lands'] ))
+        lines.append('')
+        # mana
+        lines.append('mana:')
+        lines.append('  cmc: {:.2f}'.format(s['cmc']))
+        lines.append('  avg cmc: {:.2f}'.format(s['avg_cmc']))
+        lines.append('')
+        # add devotion for main
+        lines.append('devotion:')
+        lines.extend(['  '+l for l in devotion_print(stats.devotion())])
+        lines.append('')
+        # add legal formats for main
+        lines.append('legalities:')
+        lines.extend(['  '+l for l in
+                      legal_formats_print(stats.legal_formats())])
 
-def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
+    return lines
+
+
+class ProcessState:
+    """The state of :func:`process_deck` kept between runs on the same buffer.
+
+    Sections whose lines did not change since the last run reuse their deck and
+    formatted lines, and of the other sections only added or edited card lines
+    are resolved. The output is the same as a run without a state.
+
+    `tick` and `options` are not used by :func:`process_deck`; the caller may
+    use them to skip a buffer that did not change since the last run (e.g.,
+    with the `b:changedtick` of the processed buffer). After a run,
+    `main_stats` is the :class:`DeckStats` of the Main section (or None), and
+    `stats_lines` the lines of the stats section (or None, see
+    :func:`stats_lines`). Cards moved in or out of the Main section afterwards
+    update both with :meth:`update_stats`.
+
+    If `profiler` is set (a :class:`profiler.Profiler`), card lookups,
+    rendering, and stats are timed as its 'lookup', 'render', and 'stats'
+    phases.
+
+    """
+
+    def __init__(self):
+        self.tick = None
+        self.options = None
+        self.main_stats = None
+        self.stats_lines = None
+        self.profiler = None
+        self._sections = {}
+        self._cards = {False: {}, True: {}}
+        self._begin()
+
+    def _begin(self):
+        """Start a run."""
+        self._used = {}
+        self._by_id = {}
+
+    def _end(self):
+        """End a run, keeping only the sections and cards used by it."""
+        cards = {False: {}, True: {}}
+        for ((lines, verbose), entry) in self._used.items():
+            resolved = self._cards[verbose]
+            for key in entry['keys']:
+                if key in resolved:
+                    cards[verbose][key] = resolved[key]
+        self._cards = cards
+        self._sections = self._used
+        self._begin()
+
+    def _phase(self, name):
+        """Return a context timing phase `name`, if profiling."""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def get_deck(self, deck_lines, verbose=False, warnings=True):
+        """Return a deck from a list of 'count name' lines (see :func:`get_deck`).
+
+        The deck of unchanged `deck_lines` is reused, and only cards not
+        resolved by a previous run are resolved.
+
+        """
+        key = (tuple(deck_lines), bool(verbose))
+        entry = self._used.get(key) or self._sections.get(key)
+        if entry is None:
+            with self._phase('lookup'):
+                (deck, invalid) = _get_deck(deck_lines, verbose=verbose,
+                        resolved=self._cards[bool(verbose)])
+            keys = set()
+            for (l, m) in parse_deck_lines(deck_lines):
+                if m:
+                    keys.add((card_key(m.group(2)), m.group(3)))
+            entry = {'deck': deck, 'invalid': invalid, 'keys': keys,
+                     'renders': {}}
+        self._used[key] = entry
+        self._by_id[id(entry['deck'])] = entry
+        if warnings:
+            for l in entry['invalid']:
+                vim_warning("invalid line discarded: '{}'".format(l))
+        return entry['deck']
+
+    def render(self, fn, deck, **kwargs):
+        """Return `fn(deck, **kwargs)`, reusing the result of a previous run.
+
+        :param function fn:   function formatting a deck (e.g., `std_deck`)
+        :param list     deck: a deck returned by :meth:`get_deck`
+
+        """
+        entry = self._by_id.get(id(deck))
+        with self._phase('render'):
+            if entry is None:
+                return fn(deck, **kwargs)
+            key = (fn.__name__, tuple(sorted(kwargs.items())))
+            if key not in entry['renders']:
+                entry['renders'][key] = fn(deck, **kwargs)
+            return list(entry['renders'][key])
+
+    def stats(self, deck):
+        """Return the :class:`DeckStats` of `deck`, reusing a previous run's.
+
+        :param list deck: a deck returned by :meth:`get_deck`
+
+        """
+        entry = self._by_id.get(id(deck))
+        with self._phase('stats'):
+            if entry is None:
+                return DeckStats(deck)
+            if 'stats' not in entry:
+                entry['stats'] = DeckStats(deck)
+            return entry['stats']
+
+    def card(self, name, setcode=None):
+        """Return the card `name` with legalities, or None if not known.
+
+        The card is looked up in the cards of the Main section resolved by the
+        last run and in the card cache (:data:`cache.cards`), without querying
+        the database.
+
+        """
+        key = (card_key(name), setcode)
+        c = self._cards[True].get(key)
+        if c is None:
+            c = cache.cards.get(key + (True,))
+        return c
+
+    def update_stats(self, blist, added=(), removed=()):
+        """Update the stats section of `blist` with deck cards added to and
+        removed from the Main section since the last run.
+
+        :param list blist:   list containing deck sections (e.g., a buffer
+                             list, or a :class:`DeckDocument`)
+        :param list added:   deck cards added, as {'card': Card, 'count': COUNT}
+        :param list removed: deck cards removed
+
+        The stats are updated with :meth:`DeckStats.add` and
+        :meth:`DeckStats.remove`, without processing the deck again. Return
+        whether the stats section was updated: it is left as is if the deck
+        has no stats section from the last run (e.g., it was edited since).
+
+        """
+        if self.stats_lines is None:
+            return False
+        doc = document(blist)
+        sepline = doc.separator()
+        if sepline is None:
+            return False
+        (start, stop) = (sepline+1, sepline+1+len(self.stats_lines))
+        if doc[start:stop] != self.stats_lines:
+            return False
+
+        # the stats of the last run may be shared with the section cache
+        stats = (self.main_stats or DeckStats()).copy()
+        for dcard in removed:
+            stats.remove(dcard)
+        for dcard in added:
+            stats.add(dcard)
+        lines = stats_lines(stats)
+        doc.splice(start, stop, lines)
+        self.main_stats = stats
+        self.stats_lines = lines
+        return True
+
+
+def process_deck(blist, main_sectioned=False, process_other=True, ansi=True,
+        state=None, progress=None, profiler=None):
     """Return processed deck as a list with stats.
 
     :param list blist:          list containing deck sections (e.g., a buffer list)
     :param bool main_sectioned: whether main deck is sectioned by card type
     :param bool process_other:  whether to process section Other
     :param bool ansi:           whether color
+    :param ProcessState state:  state of the previous run on `blist` (to
+                                process incrementally)
+    :param function progress:   called with a message as each section is
+                                processed (e.g., 'Sideboard')
+    :param Profiler profiler:   profiler timing the phases of the run (see
+                                :class:`ProcessState`); indexing the buffer
+                                is timed as 'index'
 
     """
-    # get buffer as list
-    b = blist
+    # reuse sections processed by the previous run
+    if state is None:
+        state = ProcessState()
+    state._begin()
+    state.main_stats = None
+    state.stats_lines = None
+    state.profiler = profiler
+
+    # get buffer as an indexed document
+    with state._phase('index'):
+        b = document(blist)
 
     # initialize
     post_deck_lines = []
+    if progress is None:
+        progress = lambda message: None
 
     ################
     #  find other  #
     ################
 
-    line_numbers = find_section(b, 3)
+    progress(DECK_OTHER)
+    line_numbers = b.section_range(3)
     if line_numbers is None:
         other_deck = []
         other_deck_lines = None
@@ -759,23 +1643,25 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
             other_deck_count = 0
         else:
             # get deck lines
-            (start_bl, end_bl) = surrounding_blanklines(b[firstline:lastline+1])
+            (start_bl, end_bl) = b.blanklines(firstline, lastline)
             other_deck_lines = b[firstline+1+start_bl:lastline+1-end_bl]
 
             # get deck
-            other_deck = get_deck(other_deck_lines,
+            other_deck = state.get_deck(other_deck_lines,
                     warnings=process_other)
 
             # get deck count
             other_deck_count = total_cards(other_deck)
 
             # create deck lines sorted by cmc, with 0 cmc last
-            other_deck_lines = std_deck(other_deck, add_setcode=add_setcode)
+            other_deck_lines = state.render(std_deck, other_deck,
+                    add_setcode=add_setcode)
 
         header = [hdr_fmt.format(DECK_OTHER, other_deck_count,
                                      hdr_fmt=hdr_fmt)]
         if process_other:
-            b[firstline:lastline+1] = header + [''] + other_deck_lines + ['']
+            b.splice(firstline, lastline+1,
+                    header + [''] + other_deck_lines + [''])
         else:
             b[firstline] = header[0]
 
@@ -784,7 +1670,8 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
     #  find sideboard  #
     ####################
 
-    line_numbers = find_section(b, 2)
+    progress(DECK_SB)
+    line_numbers = b.section_range(2)
     if line_numbers is None:
         sb_deck = []
         sb_deck_lines = None
@@ -796,49 +1683,47 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
             sb_deck_count = 0
         else:
             # get deck lines
-            (start_bl, end_bl) = surrounding_blanklines(b[firstline:lastline+1])
+            (start_bl, end_bl) = b.blanklines(firstline, lastline)
             sb_deck_lines = b[firstline+1+start_bl:lastline+1-end_bl]
 
             # get deck
-            sb_deck = get_deck(sb_deck_lines)
+            sb_deck = state.get_deck(sb_deck_lines)
 
             # get deck count
             sb_deck_count = total_cards(sb_deck)
 
             # create deck lines sorted by cmc, with 0 cmc last
             if not main_sectioned:
-                sb_deck_lines = std_deck(sb_deck, add_setcode=add_setcode)
+                sb_deck_lines = state.render(std_deck, sb_deck,
+                        add_setcode=add_setcode)
             else:
-                sb_deck_lines = std_deck(sb_deck, add_setcode=add_setcode,
-                        mana=True, ansi=ansi)
+                sb_deck_lines = state.render(std_deck, sb_deck,
+                        add_setcode=add_setcode, mana=True, ansi=ansi)
 
             # create post deck lines sorted by cmc, with 0 cmc last
             if not main_sectioned:
-                post_deck_lines = std_deck(sb_deck, add_setcode=add_setcode,
-                        mana=True, ansi=ansi)
+                post_deck_lines = state.render(std_deck, sb_deck,
+                        add_setcode=add_setcode, mana=True, ansi=ansi)
             else:
-                post_deck_lines = std_deck(sb_deck, add_setcode=add_setcode)
+                post_deck_lines = state.render(std_deck, sb_deck,
+                        add_setcode=add_setcode)
 
         header = [hdr_fmt.format(DECK_SB, sb_deck_count,
                                      hdr_fmt=hdr_fmt)]
-        b[firstline:lastline+1] = header + [''] + sb_deck_lines + ['']
+        b.splice(firstline, lastline+1, header + [''] + sb_deck_lines + [''])
 
 
     ####################
     #  find main deck  #
     ####################
 
-    line_numbers = find_section(b, 1)
+    progress(DECK_MAIN)
+    line_numbers = b.section_range(1)
     if other_deck_lines is None and sb_deck_lines is None and not line_numbers:
         # add main, if there are no sections and there are cards
-        def has_card_line(b):
-            for l in b:
-                if re_card_ln.match(l):
-                    return True
-            return False
-        if has_card_line(blist):
+        if b.has_card_line():
             b.insert(0, DECK_MAIN)
-            line_numbers = find_section(b, 1)
+            line_numbers = b.section_range(1)
 
     if line_numbers is None:
         main_deck = []
@@ -851,27 +1736,26 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
             main_deck_count = 0
         else:
             # get deck lines
-            (start_bl, end_bl) = surrounding_blanklines(b[firstline:lastline+1])
+            (start_bl, end_bl) = b.blanklines(firstline, lastline)
             main_deck_lines = b[firstline+1+start_bl:lastline+1-end_bl]
 
             # get deck
-            main_deck = get_deck(main_deck_lines, verbose=True)
+            main_deck = state.get_deck(main_deck_lines, verbose=True)
 
-            # get deck count
-            main_deck_count = total_cards(main_deck)
+            # get deck stats in one pass
+            main_stats = state.stats(main_deck)
+            state.main_stats = main_stats
 
-            # get deck legal formats
-            main_fmts = legal_formats(main_deck)
-            main_fmts_print = legal_formats_print(main_fmts)
-
-            main_dev = devotion(main_deck)
-            main_dev_print = devotion_print(main_dev)
+            # get deck count
+            main_deck_count = main_stats.total
 
             # create deck lines sorted by cmc, with 0 cmc last
             if not main_sectioned:
-                main_deck_lines = std_deck(main_deck, add_setcode=add_setcode)
+                main_deck_lines = state.render(std_deck, main_deck,
+                        add_setcode=add_setcode)
             else:
-                main_deck_lines = sectioned_deck(main_deck, ansi=ansi)
+                main_deck_lines = state.render(sectioned_deck, main_deck,
+                        ansi=ansi)
                 main_deck_lines.append('')
 
             # create post deck lines sorted by cmc, with 0 cmc last
@@ -879,9 +1763,11 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
                 post_deck_lines.insert(0, '')
             if not main_sectioned:
                 post_deck_lines.insert(0, '')
-                post_deck_lines = sectioned_deck(main_deck, ansi=ansi) + post_deck_lines
+                post_deck_lines = state.render(sectioned_deck, main_deck,
+                        ansi=ansi) + post_deck_lines
             else:
-                post_deck_lines = std_deck(main_deck, add_setcode=add_setcode) + post_deck_lines
+                post_deck_lines = state.render(std_deck, main_deck,
+                        add_setcode=add_setcode) + post_deck_lines
 
             # add blank space before post deck
             post_deck_lines.insert(0, '')
@@ -889,7 +1775,8 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
 
         header = [hdr_fmt.format(DECK_MAIN, main_deck_count,
                                      hdr_fmt=hdr_fmt)]
-        b[firstline:lastline+1] = header + [''] + main_deck_lines + ['']
+        b.splice(firstline, lastline+1,
+                header + [''] + main_deck_lines + [''])
 
 
         ###########
@@ -897,51 +1784,32 @@ def process_deck(blist, main_sectioned=False, process_other=True, ansi=True):
         ###########
 
         # add a separator for generated stats
-        sep = '----'
-        try: sepline = b[:].index(sep)+1
-        except:
+        sep = SEPARATOR
+        sepline = b.separator()
+        if sepline is not None:
+            sepline += 1
+        else:
             if not re.match('^\s*$', b[-1]): b.append('')
             b.append(sep)
             sepline = len(b)
-        b[sepline:] = []
+        b.splice(sepline, len(b), [])
 
 
         # stats
-        stats = deck_stats(main_deck)
-
-        # add mana curve
-        curve = []
-        curve.append('')
-        curve.append('mana curve:')
-        curve.extend(['  '+l for l in print_mana_curve(mana_curve(main_deck))])
-        curve.append('')
-        b.extend(curve)
-
-        if main_deck_lines:
-            # card counts
-            b.append('cards:')
-            b.append('  total: {:d}'.format( total_cards(main_deck) ))
-            b.append('  non-lands: {:d}'.format( stats['nonlands'] ))
-            b.append('  lands: {:d}'.format( stats['lands'] ))
-            b.append('')
-            # mana
-            b.append('mana:')
-            b.append('  cmc: {:.2f}'.format(stats['cmc']))
-            b.append('  avg cmc: {:.2f}'.format(stats['avg_cmc']))
-            b.append('')
-            # add devotion for main
-            b.append('devotion:')
-            b.extend(['  '+l for l in main_dev_print])
-            b.append('')
-            # add legal formats for main
-            b.append('legalities:')
-            b.extend(['  '+l for l in main_fmts_print])
+        if not main_deck_lines:
+            main_stats = DeckStats()
+        state.stats_lines = stats_lines(main_stats,
+                                        counts=bool(main_deck_lines))
+        b.extend(state.stats_lines)
 
         # add post deck
-        b = b + post_deck_lines
+        b.extend(post_deck_lines)
 
     if len(b) > 0 and b[-1] == '':
         b.pop()
 
+    state._end()
+    state.profiler = None
+
     # return list
-    return b
+    return b.lines
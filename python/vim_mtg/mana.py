@@ -0,0 +1,68 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Parsed mana costs, memoized by cost string."""
+
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+
+# colors in the order of pip counts
+COLORS = 'WUBRGSC'
+
+# a colored mana symbol, or a hybrid pair (e.g., 'R/G')
+re_mana_symbol = re.compile('([WUBRGSC])(?:/([WUBRGSC]))?')
+
+# a generic mana symbol (e.g., '{2}')
+re_generic = re.compile(r'\{(\d+)\}')
+
+# a parsed mana cost
+ManaCost = namedtuple('ManaCost', ['pips', 'hybrid', 'generic', 'ansi'])
+
+
+@lru_cache(maxsize=4096)
+def parse(manacost):
+    """Return the :class:`ManaCost` of mana cost `manacost`.
+
+    :param str manacost: a mana cost (e.g., '{1}{R/G}{R}'), or None
+
+    Fields of the return value:
+
+        pips        pip count of each color, hybrid symbols counting for
+                    both colors (e.g., (('R', 2), ('G', 1)))
+        hybrid      hybrid color pairs (e.g., (('R', 'G'),))
+        generic     generic mana amount (e.g., 1)
+        ansi        the mana cost colorized with ansi escape codes
+
+    Mana costs are parsed once; the same cost returns the same ManaCost.
+
+    """
+    if not manacost:
+        return ManaCost((), (), 0, '')
+    counts = dict.fromkeys(COLORS, 0)
+    hybrid = []
+    for (color, other) in re_mana_symbol.findall(manacost):
+        counts[color] += 1
+        if other:
+            counts[other] += 1
+            hybrid.append((color, other))
+    pips = tuple((c, n) for (c, n) in counts.items() if n > 0)
+    generic = sum(int(n) for n in re_generic.findall(manacost))
+    from mtgcard import colors as _colors
+    ansi = _colors.colorize_mana(manacost, 0)[0]
+    return ManaCost(pips, tuple(hybrid), generic, ansi)
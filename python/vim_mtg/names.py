@@ -0,0 +1,149 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Card name lists of each format, kept in files (e.g., as a source for fzf)
+and as the name index of :data:`cache.names`."""
+
+
+import os
+import re
+from os import path
+import mtgcard.settings
+from vim_mtg import cache
+from vim_mtg import database
+
+
+def list_names(format=None):
+    """Return a list of all card names, or card names in `format` if specified.
+
+    :param str format: MTG format
+
+    Formats:
+
+        standard
+        pioneer
+        modern
+        commander
+        brawl
+        pauper
+        legacy
+        vintage
+
+    The names are read from the names file of `format` (see
+    :func:`names_file`).
+
+    """
+    with open(names_file(format), encoding='utf-8') as f:
+        nameslist = f.read().splitlines()
+    if not format:
+        cache.set_names(nameslist)
+    return nameslist
+
+
+def load_index():
+    """Fill the name index (:data:`cache.names`) from the names file of all
+    cards, unless already filled, and return whether it is filled.
+
+    The names file is only read if it exists: it is not written, so the
+    database is never queried (see :func:`names_file`).
+
+    """
+    if cache.names is None:
+        try:
+            with open(_names_path(), encoding='utf-8') as f:
+                cache.set_names(f.read().splitlines())
+        except FileNotFoundError as e:
+            return False
+    return True
+
+
+def _query_names(format=None):
+    """Return the list of card names in `format` from the database."""
+    from mtgcard import mtgcard as _mtgcard
+    db = database.interface()
+    if format:
+        query = 'format:%s' % (format,)
+    else:
+        query = ''
+    nameslist = _mtgcard.list_cards(db, query, onlynames=True, onename=True)[0]
+    if nameslist:
+        return nameslist.splitlines()
+    return []
+
+
+def names_dir():
+    """Return the directory of the names files."""
+    cache_home = (os.environ.get('XDG_CACHE_HOME')
+                  or path.join(path.expanduser('~'), '.cache'))
+    return path.join(cache_home, 'vim-mtg')
+
+
+def _names_path(format=None):
+    """Return the path of the names file of `format`."""
+    name = re.sub(r'[^\w-]', '_', format or 'all')
+    return path.join(names_dir(), 'names-%s.txt' % (name,))
+
+
+def _stale(fpath):
+    """Return whether names file `fpath` is missing or older than the
+    database file."""
+    try:
+        mtime = path.getmtime(fpath)
+    except OSError as e:
+        return True
+    dbpath = database.path()
+    if dbpath is None:
+        return False
+    try:
+        return path.getmtime(dbpath) > mtime
+    except OSError as e:
+        return False
+
+
+def names_file(format=None):
+    """Return the path of the file listing the card names in `format`.
+
+    :param str format: MTG format (default: all cards)
+
+    The file lists one name per line. It is written by
+    :func:`write_names_files` after the database is updated, or on first use,
+    and written again if the database file changed since (e.g., updated
+    outside Vim).
+
+    """
+    fpath = _names_path(format)
+    if _stale(fpath):
+        write_names_file(fpath, format)
+    return fpath
+
+
+def write_names_file(fpath, format=None):
+    """Write the card names in `format` to file `fpath` and return them."""
+    nameslist = _query_names(format)
+    os.makedirs(path.dirname(fpath), exist_ok=True)
+    tmp = fpath + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.writelines(name + '\n' for name in nameslist)
+    os.replace(tmp, fpath)
+    return nameslist
+
+
+def write_names_files():
+    """Write the names files of all formats (see :func:`names_file`) and fill
+    the name index."""
+    cache.set_names(write_names_file(_names_path()))
+    for format in mtgcard.settings.SHOWN_FORMATS:
+        write_names_file(_names_path(format), format)
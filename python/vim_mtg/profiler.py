@@ -0,0 +1,124 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Wall-clock timing of the phases of deck processing (see `:MTGProfile`)."""
+
+
+import io
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """Timers of named phases, with optional cProfile and tracemalloc capture.
+
+    :param bool cprofile: whether to capture a cProfile profile of the run
+    :param bool memory:   whether to trace memory allocations of the run
+
+    Example:
+
+        profiler = Profiler()
+        with profiler.run():
+            with profiler.phase('lookup'):
+                ...
+        lines = profiler.report()
+
+    Phases should not be nested; the time of the run outside of phases is
+    reported as 'other'.
+
+    """
+
+    def __init__(self, cprofile=False, memory=False):
+        self.phases = {}
+        self.total = 0.0
+        self.cprofile = cprofile
+        self.memory = memory
+        self._profile = None
+        self._snapshot = None
+        self._peak = 0
+
+    @contextmanager
+    def phase(self, name):
+        """Time the phase `name` (accumulated over calls)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            p = self.phases.setdefault(name, [0.0, 0])
+            p[0] += time.perf_counter() - start
+            p[1] += 1
+
+    @contextmanager
+    def run(self):
+        """Time the run, capturing the profile and memory if enabled."""
+        if self.memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.cprofile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.total += time.perf_counter() - start
+            if self._profile is not None:
+                self._profile.disable()
+            if self.memory:
+                self._snapshot = tracemalloc.take_snapshot()
+                self._peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+
+    def report(self, top=20):
+        """Return the report as a list of lines.
+
+        :param int top: number of functions and allocation sites to list
+
+        """
+        lines = []
+        lines.append('{:<16s}{:>7s}{:>12s}{:>7s}'.format('phase', 'calls',
+                                                          'time (ms)', '%'))
+        total = self.total or sum(s for (s, n) in self.phases.values())
+        other = total
+        rows = []
+        for (name, (seconds, calls)) in self.phases.items():
+            rows.append((name, calls, seconds))
+            other -= seconds
+        if self.total:
+            rows.append(('other', '', max(other, 0.0)))
+        for (name, calls, seconds) in rows:
+            lines.append('{:<16s}{:>7}{:>12.2f}{:>6.0%}'.format(name, calls,
+                    seconds*1000, seconds/total if total else 0))
+        lines.append('{:<16s}{:>7s}{:>12.2f}'.format('total', '', total*1000))
+
+        if self._snapshot is not None:
+            lines.append('')
+            lines.append('memory: peak {:.1f} KiB'.format(self._peak/1024))
+            for stat in self._snapshot.statistics('lineno')[:top]:
+                lines.append('  ' + str(stat))
+
+        if self._profile is not None:
+            import pstats
+            out = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=out)
+            stats.sort_stats('cumulative').print_stats(top)
+            lines.append('')
+            lines.append('cProfile:')
+            lines.extend(l.rstrip() for l in out.getvalue().splitlines()
+                         if l.strip())
+
+        return lines
@@ -17,7 +17,19 @@
 """The Python interface to Vim settings and messages."""
 
 
-import vim
+import logging
+import threading
+try:
+    import vim
+except ImportError as e:
+    # outside of vim (e.g., vim_mtg.batch), messages are logged instead
+    vim = None
+
+log = logging.getLogger('vim_mtg')
+
+# messages of worker threads as [(function, message), ...]
+_pending = []
+_pending_lock = threading.Lock()
 
 # settings
 
@@ -67,15 +79,58 @@ class settings:
 # functions
 
 def vim_error(message):
-    """Write an error to vim."""
+    """Write an error to vim.
+
+    From a worker thread, the error is kept until :func:`flush_messages`.
+    Outside of vim, the error is logged.
+
+    """
+    if vim is None:
+        log.error(message)
+        return
+    if _pending_message('mtg#error', message):
+        return
     message = message.replace('"', r'\"')
     message = message.replace("'", r"''")
     command = "call mtg#error('{}')".format(message)
     vim.command(command)
 
 def vim_warning(message):
-    """Write a warning to vim."""
+    """Write a warning to vim.
+
+    From a worker thread, the warning is kept until :func:`flush_messages`.
+    Outside of vim, the warning is logged.
+
+    """
+    if vim is None:
+        log.warning(message)
+        return
+    if _pending_message('mtg#warning', message):
+        return
     message = message.replace('"', r'\"')
     message = message.replace("'", r"''")
     command = "call mtg#warning('{}')".format(message)
     vim.command(command)
+
+def flush_messages():
+    """Write the messages kept from worker threads to vim.
+
+    The messages are echoed without leaving the current mode (e.g., from a
+    timer callback).
+
+    """
+    with _pending_lock:
+        messages = list(_pending)
+        _pending.clear()
+    for (function, message) in messages:
+        message = message.replace("'", r"''")
+        command = "call {}('{}', 1)".format(function, message)
+        vim.command(command)
+
+def _pending_message(function, message):
+    """Keep `message` if not on the main thread and return whether kept."""
+    if threading.current_thread() is threading.main_thread():
+        return False
+    with _pending_lock:
+        _pending.append((function, message))
+    return True
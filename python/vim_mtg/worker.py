@@ -0,0 +1,174 @@
+# viMTG - The VIM 'Magic: The Gathering' deck builder.
+# Copyright (C) 2020  yoshi1@tutanota.com
+#
+# viMTG is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# viMTG is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with viMTG.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Background jobs run on worker threads and polled from Vim."""
+
+
+import queue
+import threading
+import time
+from vim_mtg import database
+
+
+class Job:
+    """A function run on a worker thread.
+
+    :param function fn: function to run as `fn(job, *args, **kwargs)`
+
+    The function may report its progress with :meth:`set_progress` and should
+    return early if :attr:`cancelled` is set. Vim polls the job (e.g., from a
+    timer) with :meth:`done` and gets the return value with :meth:`result`.
+
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        self.progress = ''
+        self.cancelled = False
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+        self._result = None
+        self._error = None
+
+    def _run(self):
+        try:
+            if not self.cancelled:
+                self._result = self._fn(self, *self._args, **self._kwargs)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done.set()
+
+    def start(self, lane='default'):
+        """Queue the job on the worker thread of `lane` and return it.
+
+        :param str lane: name of the worker thread (e.g., 'process')
+
+        The jobs of a lane run one at a time, in order, so a long job only
+        holds up the jobs of its own lane. A job cancelled before it runs is
+        skipped (its result is None).
+
+        """
+        _submit(self, lane)
+        return self
+
+    def set_progress(self, progress):
+        """Set the progress message of the job."""
+        self.progress = progress
+
+    def cancel(self):
+        """Ask the job to stop; its result should be discarded."""
+        self.cancelled = True
+
+    def done(self):
+        """Return whether the job finished."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Wait until the job finished and return whether it did."""
+        return self._done.wait(timeout)
+
+    def result(self):
+        """Return the return value of the job.
+
+        :raises Exception: the exception raised by the job, if any
+
+        """
+        if self._error is not None:
+            raise self._error
+        return self._result
+
+
+# worker threads as {lane: (queue of jobs, thread)}; a thread is started by
+# the first job of its lane and lives for the rest of the session, so
+# resources kept per thread (e.g., the database interface, see
+# :func:`database.interface`) are opened once per lane
+_lanes = {}
+_lanes_lock = threading.Lock()
+
+
+def _work(jobs):
+    """Run the jobs of queue `jobs`, until None is queued."""
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        job._run()
+
+
+def _submit(job, lane):
+    """Queue `job` on `lane`, starting its worker thread if needed."""
+    with _lanes_lock:
+        if lane not in _lanes or not _lanes[lane][1].is_alive():
+            jobs = queue.Queue()
+            thread = threading.Thread(target=_work, args=(jobs,),
+                                      name='vim_mtg worker ({})'.format(lane),
+                                      daemon=True)
+            thread.start()
+            _lanes[lane] = (jobs, thread)
+        _lanes[lane][0].put(job)
+
+
+# running jobs as {(name, bufnr): Job}
+jobs = {}
+
+
+def start(key, fn, *args, **kwargs):
+    """Start a :class:`Job` as `key`, cancelling a running job with that key.
+
+    :param tuple    key: job key as (name, bufnr)
+    :param function fn:  function to run (see :class:`Job`)
+
+    The job runs on the worker thread of its name (e.g., 'process'), so a
+    long run does not hold up the jobs of other names (e.g., searches). A
+    cancelled job still waiting in its queue is skipped.
+
+    """
+    if key in jobs:
+        jobs[key].cancel()
+    jobs[key] = Job(fn, *args, **kwargs).start(lane=key[0])
+    return jobs[key]
+
+
+def running(key):
+    """Return whether a job `key` is running."""
+    return key in jobs and not jobs[key].done()
+
+
+def shutdown(timeout=1.0):
+    """Stop the worker threads, closing their database interfaces.
+
+    :param float timeout: seconds to wait for the threads (e.g., to finish a
+                          running job)
+
+    Jobs still waiting are cancelled. The database interface of each thread
+    is closed on that thread, since it cannot be used from another one (see
+    :func:`database.interface`). A thread that does not stop in time is left
+    to end with the process.
+
+    """
+    for job in jobs.values():
+        job.cancel()
+    with _lanes_lock:
+        lanes = list(_lanes.values())
+        _lanes.clear()
+    for (pending, thread) in lanes:
+        pending.put(Job(lambda job: database.close()))
+        pending.put(None)
+    deadline = time.monotonic() + timeout
+    for (pending, thread) in lanes:
+        thread.join(max(deadline - time.monotonic(), 0))
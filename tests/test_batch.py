@@ -0,0 +1,95 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import json
+import logging
+import tempfile
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import batch
+from vim_mtg import cache
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        with open(os.path.join(self.dir, 'burn.deck'), 'w') as f:
+            f.write('Main\n4 Shock\n1 Pikachu\nSideboard\n2 Sol Ring\n')
+        with open(os.path.join(self.dir, 'notes.txt'), 'w') as f:
+            f.write('4 Shock\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch('vim_mtg.vim_interface.vim', None)
+    def test_main(self):
+        status = batch.main([self.dir, '-j', '1'])
+        self.assertEqual(status, 0)
+        output = os.path.join(self.dir, 'processed')
+        self.assertEqual(sorted(os.listdir(output)),
+                         ['batch.log', 'burn.deck', 'burn.json'])
+        with open(os.path.join(output, 'burn.deck')) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], 'Main 4')
+        with open(os.path.join(output, 'burn.json')) as f:
+            result = json.load(f)
+        self.assertEqual(result['cards'], 4)
+        self.assertEqual(result['mana_curve'], [0,4,0,0,0,0,0])
+        with open(os.path.join(output, 'batch.log')) as f:
+            log = [json.loads(l) for l in f]
+        self.assertEqual(log, [{'deck': 'burn.deck', 'level': 'WARNING',
+            'message': "invalid line discarded: '1 Pikachu'"}])
+
+    @patch('vim_mtg.vim_interface.vim', None)
+    def test_missing_deck_file(self):
+        # a deck file deleted during the run is an error of that deck only
+        real_open = open
+        def open_deck(path, *args, **kwargs):
+            if path.endswith('burn.deck') and 'processed' not in path:
+                raise FileNotFoundError(2, 'No such file', path)
+            return real_open(path, *args, **kwargs)
+        with patch('builtins.open', open_deck):
+            status = batch.main([self.dir, '-j', '1'])
+        self.assertEqual(status, 1)
+        with open(os.path.join(self.dir, 'processed', 'batch.log')) as f:
+            log = [json.loads(l) for l in f]
+        self.assertEqual(log[0]['level'], 'ERROR')
+        self.assertIn('FileNotFoundError', log[0]['message'])
+
+    @patch('vim_mtg.vim_interface.vim', None)
+    def test_missing_database(self):
+        with patch('vim_mtg.database.interface',
+                   side_effect=FileNotFoundError):
+            status = batch.main([self.dir, '-j', '1'])
+        self.assertEqual(status, 2)
+
+    @patch('vim_mtg.vim_interface.vim', None)
+    def test_messages_not_propagated(self):
+        handler = logging.Handler()
+        handler.emit = Mock()
+        logging.getLogger().addHandler(handler)
+        self.addCleanup(logging.getLogger().removeHandler, handler)
+        batch.main([self.dir, '-j', '1'])
+        handler.emit.assert_not_called()
+        self.assertTrue(batch.log.propagate)
+
+    def test_summary_without_main(self):
+        result = batch.summary(None)
+        self.assertEqual(result['cards'], 0)
+        self.assertEqual(result['legal_formats'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
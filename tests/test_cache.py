@@ -0,0 +1,80 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import cache
+from vim_mtg.cache import LRUCache
+from vim_mtg.deck import get_deck
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_get_missing(self):
+        c = LRUCache(2)
+        self.assertEqual(c.get('a'), None)
+        self.assertEqual(c.get('a', 0), 0)
+
+    def test_evict_least_recently_used(self):
+        c = LRUCache(2)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.get('a')
+        c.put('c', 3)
+        self.assertIn('a', c)
+        self.assertNotIn('b', c)
+        self.assertIn('c', c)
+
+    def test_resize(self):
+        c = LRUCache(3)
+        c.put('a', 1)
+        c.put('b', 2)
+        c.put('c', 3)
+        c.resize(1)
+        self.assertEqual(len(c), 1)
+        self.assertIn('c', c)
+
+    def test_disabled(self):
+        c = LRUCache(0)
+        c.put('a', 1)
+        self.assertEqual(len(c), 0)
+
+
+class CardCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_reprocess_without_database(self):
+        b = '''
+4	Shock
+1	Pikachu
+'''.strip().splitlines()
+        get_deck(b, warnings=False)
+        with patch('vim_mtg.database.interface') as interface:
+            d = get_deck(b, warnings=False)
+            interface.return_value.get_card.assert_not_called()
+        self.assertEqual(len(d), 1)
+        self.assertEqual(d[0]['card'].name, 'Shock')
+
+    def test_verbose_is_separate(self):
+        b = '''
+4	Shock
+'''.strip().splitlines()
+        get_deck(b)
+        self.assertIn(('shock', None, False), cache.cards)
+        self.assertNotIn(('shock', None, True), cache.cards)
+
+    def test_clear(self):
+        get_deck(['4 Shock'])
+        cache.clear()
+        self.assertEqual(len(cache.cards), 0)
@@ -0,0 +1,452 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import threading
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import MagicMock, Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from mtgcard.card import Card
+from vim_mtg import cache
+from vim_mtg import card
+from vim_mtg import worker
+
+
+def render(cards, n, image=False, ansi=True):
+    return ['[%s]' % (c.name,) for c in cards]
+
+
+def parse(query):
+    if 'bad' in query:
+        raise ValueError('bad query')
+    return ('Q', query)
+
+
+class SortCardsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cards = [
+            Card(name='Shock', setcode='M20', cmc=1, price=0.25),
+            Card(name='Embercleave', setcode='ELD', cmc=6, price=None),
+            Card(name='Counterspell', setcode='MH2', cmc=2, price=1.5),
+            Card(name='Bolt', setcode='M10', cmc=1, price=2.0),
+        ]
+
+    def names(self, cards):
+        return [c.name for c in cards]
+
+    def test_order(self):
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'cmc')),
+                ['Bolt', 'Shock', 'Counterspell', 'Embercleave'])
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'name')),
+                ['Bolt', 'Counterspell', 'Embercleave', 'Shock'])
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'setcode')),
+                ['Embercleave', 'Bolt', 'Shock', 'Counterspell'])
+
+    def test_reverse(self):
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'cmc', True)),
+                ['Embercleave', 'Counterspell', 'Bolt', 'Shock'])
+
+    def test_unknown_last(self):
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'price')),
+                ['Shock', 'Counterspell', 'Bolt', 'Embercleave'])
+        self.assertEqual(self.names(card.sort_cards(self.cards, 'price', True)),
+                ['Bolt', 'Counterspell', 'Shock', 'Embercleave'])
+
+
+class FindCardsTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.db = Mock()
+        self.db.get_cards.return_value = [
+            Card(name='Shock', cmc=1), Card(name='Embercleave', cmc=6)]
+        patcher = patch('vim_mtg.database.interface', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        cards = card.find_cards('t:instant')
+        self.assertIs(card.find_cards('t:instant'), cards)
+        self.assertEqual(self.db.get_cards.call_count, 1)
+        card.find_cards('t:sorcery')
+        self.assertEqual(self.db.get_cards.call_count, 2)
+
+    def test_resort(self):
+        card.find_cards('t:instant')
+        cards = card.find_cards('t:instant', order='cmc', reverse=True)
+        self.assertEqual([c.name for c in cards], ['Embercleave', 'Shock'])
+        cards = card.find_cards('t:instant', order='name')
+        self.assertEqual([c.name for c in cards], ['Embercleave', 'Shock'])
+        self.assertEqual(self.db.get_cards.call_count, 1)
+
+    def test_format(self):
+        card.find_cards('t:instant')
+        card.find_cards('t:instant', 'modern')
+        self.assertEqual(self.db.get_cards.call_count, 2)
+        card.find_cards('format:modern  t:instant')
+        self.assertEqual(self.db.get_cards.call_count, 2)
+
+    def test_clear(self):
+        card.find_cards('t:instant')
+        cache.clear()
+        card.find_cards('t:instant')
+        self.assertEqual(self.db.get_cards.call_count, 2)
+
+    def test_no_cards(self):
+        self.db.get_cards.return_value = None
+        self.assertIsNone(card.find_cards('t:instant'))
+        self.assertIsNone(card.find_cards('t:instant'))
+        self.assertEqual(self.db.get_cards.call_count, 2)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            card.find_cards('bad query')
+
+
+class ParseQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = patch('mtgcard.parser.parser.parse', side_effect=parse)
+        self.parse = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_format_query(self):
+        self.assertEqual(card.format_query('t:instant'), 't:instant')
+        self.assertEqual(card.format_query('t:instant', 'modern'),
+                         'format:modern t:instant')
+        self.assertEqual(card.format_query('', 'modern'), 'format:modern')
+
+    def test_normalize(self):
+        self.assertEqual(card.normalize_query('  t:instant   c=r '),
+                         't:instant c=r')
+        self.assertEqual(card.normalize_query('text:"deals  3"  t:instant'),
+                         'text:"deals  3" t:instant')
+
+    def test_cached(self):
+        self.assertEqual(card.parse_query('t:instant  c=r'),
+                         ('Q', 't:instant c=r'))
+        card.parse_query(' t:instant c=r')
+        self.assertEqual(self.parse.call_count, 1)
+
+    def test_error_cached(self):
+        for i in range(2):
+            with self.assertRaisesRegex(ValueError, 'bad query'):
+                card.parse_query('bad')
+        self.assertEqual(self.parse.call_count, 1)
+
+    def test_format_toggle(self):
+        db = Mock()
+        db.get_cards.return_value = None
+        with patch('vim_mtg.database.interface', return_value=db):
+            for format in ('modern', 'legacy'):
+                with self.assertRaises(ValueError):
+                    card.find_cards('bad', format)
+        # the query of each format is parsed once, with the format
+        self.assertEqual([c[0] for c in self.parse.call_args_list],
+                         [('format:modern bad',), ('format:legacy bad',)])
+        with patch('vim_mtg.database.interface', return_value=db):
+            with self.assertRaises(ValueError):
+                card.find_cards('bad', 'modern')
+        self.assertEqual(self.parse.call_count, 2)
+
+
+class SearchResultsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cards = [Card(name='Card %d' % (i,), cmc=i % 7) for i in range(10)]
+        patcher = patch('mtgcard.mtgcard.list_cards_images', side_effect=render)
+        self.render = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_pages(self):
+        results = card.SearchResults(self.cards)
+        self.assertEqual(len(results), 10)
+        self.assertEqual(results.next_page(3), ['[Card 0]', '[Card 1]',
+                                                '[Card 2]', '[Card 3]'])
+        self.assertEqual(results.next_page(4), ['[Card 4]', '[Card 5]',
+                                                '[Card 6]', '[Card 7]'])
+        self.assertFalse(results.done())
+        self.assertEqual(results.next_page(), ['[Card 8]', '[Card 9]'])
+        self.assertTrue(results.done())
+        self.assertEqual(results.next_page(), [])
+        self.assertEqual(self.render.call_count, 3)
+
+    def test_first_pages(self):
+        results = card.SearchResults(self.cards * 10)
+        lines = results.first_pages(50)
+        self.assertEqual(len(lines), 2 * card.SEARCH_PAGE_SIZE)
+        self.assertEqual(results.rendered, 2 * card.SEARCH_PAGE_SIZE)
+        self.assertEqual(len(card.SearchResults([]).first_pages(50)), 0)
+
+    def test_search_more(self):
+        buf = MagicMock(number=7)
+        results = card.SearchResults(self.cards)
+        results.next_page(8)
+        cache.searches[7] = results
+        self.addCleanup(cache.searches.clear)
+        card.search_more(buf)
+        buf.append.assert_called_once_with(['[Card 8]', '[Card 9]'])
+        card.search_more(buf)
+        card.search_more(MagicMock(number=8))
+        self.assertEqual(buf.append.call_count, 1)
+
+
+class BackgroundSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(cache.searches.clear)
+        self.addCleanup(worker.jobs.clear)
+        self.db = Mock()
+        self.db.get_cards.return_value = [Card(name='Shock', cmc=1)]
+        patchers = [
+            patch('vim_mtg.database.interface', return_value=self.db),
+            patch('mtgcard.mtgcard.list_cards_images', side_effect=render),
+            patch('vim_mtg.card.vim'),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.sbuf = MagicMock(number=3)
+        self.sbuf.vars = {}
+        card.vim.buffers = {3: self.sbuf}
+        card.vim.eval.return_value = '1'
+
+    def start(self, fquery, generation):
+        job = worker.start(('search', 3), card._find_and_render, fquery, None,
+                order='cmc', reverse=False, ansi=False, nlines=10)
+        job.fquery = fquery
+        job.generation = generation
+        job.wait(5)
+        return job
+
+    def test_results(self):
+        self.start('t:instant', 1)
+        self.assertTrue(card.poll_search(3, 1))
+        self.sbuf.__setitem__.assert_called_once_with(slice(None), ['[Shock]'])
+        self.assertEqual(self.sbuf.vars['mtg_search_status'],
+                         '1 matches (t:instant)')
+        self.assertEqual(len(cache.searches[3]), 1)
+        self.assertNotIn(('search', 3), worker.jobs)
+
+    def test_running(self):
+        release = threading.Event()
+        self.db.get_cards.side_effect = lambda *args, **kwargs: (
+                release.wait(5) and [Card(name='Shock', cmc=1)])
+        job = worker.start(('search', 3), card._find_and_render, 't:instant', None,
+                order='cmc', reverse=False, ansi=False, nlines=10)
+        job.fquery = 't:instant'
+        job.generation = 1
+        self.assertFalse(card.poll_search(3, 1))
+        release.set()
+        job.wait(5)
+        self.assertTrue(card.poll_search(3, 1))
+        self.assertEqual(self.sbuf.vars['mtg_search_status'],
+                         '1 matches (t:instant)')
+
+    def test_superseded(self):
+        self.start('t:instant', 1)
+        self.start('t:sorcery', 2)
+        self.assertTrue(card.poll_search(3, 1))
+        self.assertNotIn('mtg_search_status', self.sbuf.vars)
+        self.assertTrue(card.poll_search(3, 2))
+        self.assertEqual(self.sbuf.vars['mtg_search_status'],
+                         '1 matches (t:sorcery)')
+
+    def test_cancelled(self):
+        job = worker.Job(card._find_and_render, 't:instant', None, order='cmc',
+                reverse=False, ansi=False, nlines=10)
+        job.cancel()
+        job.start().wait(5)
+        self.assertIsNone(job.result())
+
+    def test_no_cards(self):
+        self.db.get_cards.return_value = None
+        self.start('t:instant', 1)
+        self.assertTrue(card.poll_search(3, 1))
+        self.assertEqual(self.sbuf.vars['mtg_search_status'],
+                         'no cards found (t:instant)')
+        self.assertNotIn(3, cache.searches)
+
+    def test_invalid(self):
+        self.start('bad query', 1)
+        self.assertTrue(card.poll_search(3, 1))
+        self.assertEqual(self.sbuf.vars['mtg_search_status'],
+                         'bad query (bad query)')
+
+
+class RenderPreviewTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.card = Card(name='Shock', setcode='M20', cmc=1, manacost='R',
+                         price=0.25)
+        patcher = patch('vim_mtg.deck.get_card', return_value=self.card)
+        self.get_card = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        lines, price = card.render_preview('Shock')
+        self.assertEqual(lines, ['CARD Shock', 'R'])
+        self.assertEqual(price, 0.25)
+        self.assertEqual(card.render_preview('shock'), (lines, price))
+        self.assertEqual(self.get_card.call_count, 1)
+
+    def test_key(self):
+        card.render_preview('Shock')
+        card.render_preview('Shock', 'M20')
+        card.render_preview('Shock', ansi=False)
+        card.render_preview('Shock', show_price=False)
+        with patch('mtgcard.settings.CURRENCY', 'EUR'):
+            card.render_preview('Shock')
+        self.assertEqual(self.get_card.call_count, 5)
+
+    def test_verbose(self):
+        db = Mock()
+        with patch('vim_mtg.database.interface', return_value=db), \
+                patch('mtgcard.mtgcard.get_and_print_card',
+                      return_value='VERBOSE\nShock') as print_card:
+            self.assertEqual(card.render_preview('Shock', verbose=True)[0],
+                             ['VERBOSE', 'Shock'])
+            card.render_preview('Shock', verbose=True)
+        self.assertEqual(print_card.call_count, 1)
+        card.render_preview('Shock')
+        self.assertEqual(self.get_card.call_count, 2)
+
+    def test_transform(self):
+        self.card.layout = 'transform'
+        back = Card(name='Back', manacost=None)
+        with patch('mtgcard.util.get_transform_meld_sideb',
+                   return_value=back) as sideb:
+            lines, price = card.render_preview('Shock')
+            card.render_preview('Shock')
+        self.assertEqual(lines, ['CARD Shock', 'R', 'CARD Back', 'None'])
+        self.assertEqual(sideb.call_count, 1)
+
+    def test_clear(self):
+        card.render_preview('Shock')
+        cache.clear()
+        card.render_preview('Shock')
+        self.assertEqual(self.get_card.call_count, 2)
+
+
+class PreviewTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patchers = [
+            patch('vim_mtg.card.vim', MagicMock()),
+            patch('vim_mtg.card.settings.get', return_value=True),
+            patch('vim_mtg.deck.get_card', return_value=Card(
+                name='Shock', setcode='M20', cmc=1, manacost='R', price=0.25)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_price(self):
+        # not verbose, price shown (the defaults)
+        self.assertTrue(card.preview('Shock', prevfile='/tmp/x-mtg_card'))
+        window = card.vim.current.window
+        window.options.__setitem__.assert_any_call(
+                'statusline', '[Preview] USD: $0.25')
+        card.vim.current.buffer.__setitem__.assert_called_with(
+                slice(None), ['CARD Shock', 'R'])
+
+
+class PrefetchTest(unittest.TestCase):
+
+    blist = [
+        'Main',
+        '',
+        'Creatures',
+        '4 Bonecrusher Giant',
+        '4 Fervent Champion ELD',
+        '',
+        'Instants',
+        '4 Shock',
+        '2 Mana Leak',
+        '',
+        'Lands',
+        '20 Forest',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(worker.jobs.clear)
+
+    def test_neighbor_cards(self):
+        cards, first, last = card.neighbor_cards(self.blist, 7, n=2)
+        self.assertEqual(cards, [('Mana Leak', None),
+                                 ('Fervent Champion', 'ELD'),
+                                 ('Forest', None),
+                                 ('Bonecrusher Giant', None)])
+        self.assertEqual((first, last), (3, 11))
+
+    def test_neighbor_cards_edges(self):
+        cards, first, last = card.neighbor_cards(self.blist, 11, n=1)
+        self.assertEqual(cards, [('Mana Leak', None)])
+        self.assertEqual((first, last), (8, 11))
+        cards, first, last = card.neighbor_cards(self.blist, 0, n=1)
+        self.assertEqual(cards, [('Bonecrusher Giant', None)])
+        self.assertEqual((first, last), (0, 3))
+
+    def test_prefetch(self):
+        buf = MagicMock(number=5)
+        buf.__len__.return_value = len(self.blist)
+        buf.__getitem__.side_effect = self.blist.__getitem__
+        with patch('vim_mtg.card.settings.get', return_value=True), \
+                patch('vim_mtg.deck.get_card',
+                      side_effect=lambda name, setcode=None, verbose=False:
+                      Card(name=name, setcode=setcode)) as get_card:
+            self.assertEqual(card.prefetch(buf, 7), (0, 11))
+            self.assertTrue(worker.jobs[('prefetch', 5)].wait(5))
+            self.assertEqual(get_card.call_count, 4)
+            # previews are rendered now
+            card.render_preview('Mana Leak', show_price=True)
+            card.render_preview('Forest', show_price=True)
+            self.assertEqual(get_card.call_count, 4)
+
+    def test_cancel(self):
+        started = threading.Event()
+        release = threading.Event()
+        def get_card(name, setcode=None, verbose=False):
+            started.set()
+            release.wait(5)
+            return Card(name=name, setcode=setcode)
+        with patch('vim_mtg.deck.get_card', side_effect=get_card) as get_card:
+            job = worker.start(('prefetch', 5), card._prefetch,
+                    [('Shock', None), ('Forest', None)], verbose=False,
+                    ansi=True, show_price=True)
+            self.assertTrue(started.wait(5))
+            card.cancel_prefetch(5)
+            release.set()
+            job.wait(5)
+        self.assertEqual(get_card.call_count, 1)
+        self.assertNotIn(('prefetch', 5), worker.jobs)
+
+    def test_not_found(self):
+        with patch('vim_mtg.deck.get_card', side_effect=ValueError):
+            job = worker.Job(card._prefetch, [('Nope', None)], verbose=False,
+                    ansi=True, show_price=True).start()
+            job.wait(5)
+        self.assertIsNone(job.result())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import database
+
+
+class InterfaceTest(unittest.TestCase):
+
+    def setUp(self):
+        database.close()
+
+    def tearDown(self):
+        database.close()
+
+    def test_opened_once(self):
+        with patch('mtgcard.mtgdb.Interface') as interface:
+            db1 = database.interface()
+            db2 = database.interface()
+        interface.assert_called_once_with()
+        self.assertIs(db1, db2)
+
+    def test_reopen_after_close(self):
+        with patch('mtgcard.mtgdb.Interface') as interface:
+            db1 = database.interface()
+            database.close()
+            db2 = database.interface()
+        self.assertEqual(interface.call_count, 2)
+        db1.close.assert_called_once_with()
+
+    def test_not_found(self):
+        with patch('mtgcard.mtgdb.Interface', side_effect=FileNotFoundError):
+            self.assertRaises(FileNotFoundError, database.interface)
+        with patch('mtgcard.mtgdb.Interface') as interface:
+            database.interface()
+        interface.assert_called_once_with()
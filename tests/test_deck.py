@@ -5,25 +5,35 @@ root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
 python_dir = os.path.join(root_dir, 'python')
 sys.path.append(python_dir)
 
+import tempfile
 import unittest
 from tests import load_tests
 load_tests.__module__ = __name__
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 sys.modules['vim'] = Mock()
 
 from mtgcard.card import Card
 
+from vim_mtg import cache
+from vim_mtg import names
+
 from vim_mtg.deck import add_section
 from vim_mtg.deck import add_to_section
 from vim_mtg.deck import move_card
 from vim_mtg.deck import move_cards
 from vim_mtg.deck import get_section
+from vim_mtg.deck import DeckDocument
+from vim_mtg.deck import buffer_document
+from vim_mtg.deck import CardLine
 from vim_mtg.deck import get_deck
+from vim_mtg.deck import get_card
+from vim_mtg.deck import resolve_cards
 from vim_mtg.deck import find_section
 from vim_mtg.deck import mana_curve
 from vim_mtg.deck import print_mana_curve
 from vim_mtg.deck import process_deck
+from vim_mtg.deck import ProcessState
 from vim_mtg.deck import sectioned_deck
 from vim_mtg.deck import surrounding_blanklines
 from vim_mtg.deck import card_line_print
@@ -34,6 +44,14 @@ from vim_mtg.deck import legal_formats_print
 from vim_mtg.deck import devotion
 from vim_mtg.deck import devotion_print
 from vim_mtg.deck import deck_stats
+from vim_mtg.deck import DeckStats
+from vim_mtg.deck import DeckEntry
+from vim_mtg.deck import SHOWN_FORMATS
+from vim_mtg.deck import legality_masks
+from vim_mtg.deck import legal_mask
+from vim_mtg.deck import format_names
+from vim_mtg.deck import format_breakers
+from vim_mtg.deck import restricted_counts
 
 def setUpModule():
 
@@ -45,6 +63,18 @@ def setUpModule():
     DECK_OTHER = 'Other'
 
 
+def use_names_dir(test):
+    """Keep the names files of `test` in a temporary directory, without a
+    name index loaded."""
+    tmpdir = tempfile.TemporaryDirectory()
+    test.addCleanup(tmpdir.cleanup)
+    patcher = patch.dict('os.environ', {'XDG_CACHE_HOME': tmpdir.name})
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    cache.names = None
+    test.addCleanup(setattr, cache, 'names', None)
+
+
 class PrintManaCurveTest(unittest.TestCase):
 
     def test_empty_deck(self):
@@ -183,6 +213,21 @@ class GetDeckTest(unittest.TestCase):
         self.assertEqual(d[1]['card'].name, 'Mana Leak')
         self.assertEqual(d[1]['card'].cmc, 2)
 
+    def test_duplicates_combined(self):
+        b = '''
+4	Shock
+2	Mana Leak
+1	shock
+1	Shock 10E
+'''.strip().splitlines()
+        d = get_deck(b)
+        self.assertEqual(len(d), 2)
+        self.assertEqual(d[0]['card'].name, 'Shock')
+        self.assertEqual(d[0]['card'].setcode, 'M20')
+        self.assertEqual(d[0]['count'], 6)
+        self.assertEqual(d[1]['card'].name, 'Mana Leak')
+        self.assertEqual(d[1]['count'], 2)
+
     # value errors
 
     #     def test_invalid_card(self):
@@ -192,6 +237,113 @@ class GetDeckTest(unittest.TestCase):
     #         self.assertRaises(ValueError, get_deck, b)
 
 
+class ResolveCardsTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(resolve_cards([]), {})
+
+    def test_duplicates(self):
+        keys = [('Shock', None), ('shock', None), ('Shock', '10E')]
+        cards = resolve_cards(keys)
+        self.assertEqual(len(cards), 2)
+        self.assertEqual(cards[('shock', None)].name, 'Shock')
+        self.assertEqual(cards[('shock', '10E')].setcode, '10E')
+
+    def test_invalid_card(self):
+        keys = [('Pikachu', None), ('Shock', None)]
+        cards = resolve_cards(keys)
+        self.assertIsNone(cards[('pikachu', None)])
+        self.assertEqual(cards[('shock', None)].name, 'Shock')
+
+
+class DeckDocumentTest(unittest.TestCase):
+
+    def test_index(self):
+        b = f'''
+{DECK_MAIN} 6
+4 Shock
+
+2x Mana Leak 10E
+{DECK_SB}
+----
+'''.strip().splitlines()
+        doc = DeckDocument(b)
+        self.assertEqual(doc.headers, [0, 4, 5])
+        self.assertEqual(doc.cards[1], CardLine(4, 'Shock', None))
+        self.assertEqual(doc.cards[3], CardLine(2, 'Mana Leak', '10E'))
+        self.assertEqual(doc.section_range(1), (0, 3))
+        self.assertEqual(doc.section_range(2), (4, 4))
+        self.assertEqual(doc.section_range(3), None)
+        self.assertEqual(doc.section_of(2), 1)
+        self.assertEqual(doc.section_of(5), -1)
+        self.assertEqual(doc.blanklines(0, 3), (0, 0))
+        self.assertEqual(doc.separator(), 5)
+
+    def test_edits_update_index(self):
+        b = [DECK_MAIN, '4 Shock', DECK_OTHER]
+        doc = DeckDocument(b)
+        doc.insert(2, DECK_SB)
+        doc.insert(3, '1 Island')
+        self.assertIs(doc.lines, b)
+        self.assertEqual(b, [DECK_MAIN, '4 Shock', DECK_SB, '1 Island',
+                             DECK_OTHER])
+        self.assertEqual(doc.section_range(1), (0, 1))
+        self.assertEqual(doc.section_range(2), (2, 3))
+        self.assertEqual(doc.section_of(3), 2)
+        self.assertEqual(doc.section_of(4), 3)
+        doc.pop(0)
+        self.assertEqual(doc.section_of(0), None)
+        self.assertEqual(doc.section_range(1), None)
+        doc.splice(1, 3, ['----'])
+        self.assertEqual(b, ['4 Shock', '----', DECK_OTHER])
+        self.assertEqual(doc.section_range(3), (2, 2))
+        self.assertEqual(doc.section_of(1), -1)
+
+    def test_section_of(self):
+        b = f'''
+notes
+{DECK_MAIN} 60
+4 Shock
+{DECK_SB} 15
+
+{DECK_OTHER}
+---- stats
+Total: 60
+'''.strip().splitlines()
+        doc = DeckDocument(b)
+        actual_result = [doc.section_of(i) for i in range(len(b))]
+        self.assertEqual(actual_result, [None, 1, 1, 2, 2, 3, -1, -1])
+        doc.pop(1)
+        self.assertEqual(doc.section_of(1), None)
+        with self.assertRaises(ValueError):
+            doc.section_of(7)
+
+    def test_functions_accept_document(self):
+        b = [DECK_MAIN, '2 Fervent Champion', DECK_SB]
+        doc = DeckDocument(b)
+        self.assertEqual(find_section(doc, 2), (2, 2))
+        self.assertEqual(get_section(doc, 1), 1)
+        self.assertIs(add_to_section(doc, 'Shock', 1, 2), doc)
+        self.assertEqual(b, [DECK_MAIN, '2 Fervent Champion', DECK_SB,
+                             '1 Shock'])
+
+
+class BufferDocumentTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.documents.clear()
+
+    def test_reused_until_changed(self):
+        buffer = Mock(number=1)
+        buffer.__getitem__ = Mock(return_value=[DECK_MAIN, '4 Shock'])
+        doc = buffer_document(buffer, 5)
+        self.assertEqual(doc.section_of(1), 1)
+        self.assertIs(buffer_document(buffer, 5), doc)
+        self.assertEqual(buffer.__getitem__.call_count, 1)
+        self.assertIsNot(buffer_document(buffer, 6), doc)
+        self.assertEqual(buffer.__getitem__.call_count, 2)
+
+
 class FindDeckTest(unittest.TestCase):
 
     def test_zero_lines(self):
@@ -605,6 +757,111 @@ Creatures 2
         self.assertEqual(actual_result, expected_result)
 
 
+class ProcessDeckIncrementalTest(unittest.TestCase):
+
+    def test_same_as_full(self):
+        b = f'''
+{DECK_MAIN}
+4	Fervent Champion
+{DECK_SB}
+2	Shock
+1	Pikachu
+'''.strip().splitlines()
+        state = ProcessState()
+        actual_result = process_deck(list(b), ansi=False, state=state)
+        expected_result = process_deck(list(b), ansi=False)
+        self.assertEqual(actual_result, expected_result)
+
+        b[1] = '3	Fervent Champion'
+        actual_result = process_deck(list(b), ansi=False, state=state)
+        expected_result = process_deck(list(b), ansi=False)
+        self.assertEqual(actual_result, expected_result)
+
+    def test_unchanged_section_reused(self):
+        b = f'''
+{DECK_MAIN}
+4	Fervent Champion
+{DECK_SB}
+2	Shock
+'''.strip().splitlines()
+        state = ProcessState()
+        process_deck(list(b), ansi=False, state=state)
+        b.insert(2, '1	Embercleave')
+        with patch('vim_mtg.deck.resolve_cards',
+                   wraps=resolve_cards) as resolve:
+            process_deck(list(b), ansi=False, state=state)
+        resolve.assert_called_once_with([('Embercleave', None)], verbose=True)
+
+
+class UpdateStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        use_names_dir(self)
+        names.names_file()
+        cache.clear()
+        self.b = f'''
+{DECK_MAIN}
+4	Fervent Champion
+2	Sol Ring
+{DECK_SB}
+2	Shock
+'''.strip().splitlines()
+        self.state = ProcessState()
+        self.b = process_deck(self.b, ansi=False, state=self.state)
+
+    def assertStatsUpdated(self, b):
+        # the stats section is the one of the deck processed again
+        state = ProcessState()
+        process_deck(list(b), ansi=False, state=state)
+        sepline = b.index('----')
+        self.assertEqual(b[sepline+1:sepline+1+len(state.stats_lines)],
+                         state.stats_lines)
+        self.assertEqual(self.state.stats_lines, state.stats_lines)
+
+    def test_move_card_out_of_main(self):
+        index = self.b.index('2 Sol Ring')
+        with patch('vim_mtg.database.interface') as interface:
+            b = move_card(self.b, index, 2, 1, state=self.state)
+        interface.assert_not_called()
+        self.assertIn('  total: 5', b)
+        self.assertStatsUpdated(b)
+        b = move_card(b, b.index('1 Sol Ring'), 2, state=self.state)
+        self.assertIn('  total: 4', b)
+        self.assertStatsUpdated(b)
+
+    def test_move_card_into_main(self):
+        b = move_card(self.b, self.b.index('4 Fervent Champion'), 2,
+                      state=self.state)
+        b = move_card(b, b.index('4 Fervent Champion'), 1, state=self.state)
+        self.assertStatsUpdated(b)
+        self.assertEqual(b, self.b)
+
+    def test_unknown_card_not_updated(self):
+        # the sideboard is resolved without legalities
+        b = move_card(self.b, self.b.index('2 Shock'), 1, state=self.state)
+        self.assertIsNone(self.state.stats_lines)
+        self.assertEqual(b[b.index('----'):], self.b[self.b.index('----'):])
+        b = move_card(b, b.index('2 Sol Ring'), 2, state=self.state)
+        self.assertEqual(b[b.index('----'):], self.b[self.b.index('----'):])
+
+    def test_add_to_section(self):
+        b = add_to_section(self.b, 'Shock', 2, 1, state=self.state)
+        self.assertIn('  total: 8', b)
+        self.assertStatsUpdated(b)
+
+    def test_edited_stats_not_updated(self):
+        self.b[self.b.index('----')+2] = 'edited'
+        b = move_card(self.b, self.b.index('2 Sol Ring'), 2, state=self.state)
+        self.assertIn('  total: 6', b)
+
+    def test_section_stats_not_changed(self):
+        # the stats of the main deck are reused by the next run
+        main_stats = self.state.main_stats
+        curve = main_stats.mana_curve()
+        move_card(self.b, self.b.index('2 Sol Ring'), 2, state=self.state)
+        self.assertEqual(main_stats.mana_curve(), curve)
+
+
 class AddSectionTest(unittest.TestCase):
 
     def test_add_main(self):
@@ -856,6 +1113,10 @@ class GetSectionTest(unittest.TestCase):
 
 class MoveCardTest(unittest.TestCase):
 
+    def setUp(self):
+        use_names_dir(self)
+        names.names_file()
+
     def test_one_card_from_main_to_sb(self):
         b = f'''
 {DECK_MAIN}
@@ -928,6 +1189,82 @@ class MoveCardTest(unittest.TestCase):
         actual_result = move_card(b, 1, 2, 1)
         self.assertEqual(actual_result, expected_result)
 
+    def test_canonical_name(self):
+        b = f'''
+{DECK_MAIN}
+2x fervent champion
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+{DECK_SB}
+2 Fervent Champion
+'''.strip().splitlines()
+        actual_result = move_card(b, 1, 2)
+        self.assertEqual(actual_result, expected_result)
+
+    def test_without_database(self):
+        b = f'''
+{DECK_MAIN}
+2 shock
+1 Pikachu
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+1 Pikachu
+{DECK_SB}
+2 Shock
+'''.strip().splitlines()
+        with patch('vim_mtg.database.interface') as interface:
+            actual_result = move_card(b, 1, 2)
+            actual_result = move_card(actual_result, 1, 2)
+        interface.assert_not_called()
+        self.assertEqual(actual_result, expected_result)
+
+    def test_no_index_loaded(self):
+        # the index is loaded from the names file, not the database
+        b = f'''
+{DECK_MAIN}
+2 shock
+1 Pikachu
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+1 Pikachu
+{DECK_SB}
+2 Shock
+'''.strip().splitlines()
+        cache.names = None
+        with patch('vim_mtg.database.interface') as interface:
+            actual_result = move_card(b, 1, 2)
+            self.assertEqual(cache.names['shock'], 'Shock')
+            actual_result = move_card(actual_result, 1, 2)
+        interface.assert_not_called()
+        self.assertEqual(actual_result, expected_result)
+
+    def test_no_names_file_no_database(self):
+        # without a names file, the line is moved as typed
+        use_names_dir(self)
+        b = f'''
+{DECK_MAIN}
+2 shock
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+{DECK_SB}
+2 shock
+'''.strip().splitlines()
+        with patch('vim_mtg.database.interface',
+                   side_effect=FileNotFoundError) as interface, \
+                patch('vim_mtg.database.path', return_value=None):
+            actual_result = move_card(b, 1, 2)
+        interface.assert_not_called()
+        self.assertIsNone(cache.names)
+        self.assertEqual(actual_result, expected_result)
+
     def test_not_in_section(self):
         b = f'''
 2 Fervent Champion
@@ -984,6 +1321,10 @@ class MoveCardTest(unittest.TestCase):
 
 class MoveCardsTest(unittest.TestCase):
 
+    def setUp(self):
+        use_names_dir(self)
+        names.names_file()
+
     def test_two_different_cards_from_main_to_sb(self):
         b = f'''
 {DECK_MAIN}
@@ -1153,6 +1494,43 @@ class MoveCardsTest(unittest.TestCase):
         actual_result = move_cards(b, [0,1,2,3,4], 2)
         self.assertEqual(actual_result, expected_result)
 
+    def test_duplicates_combined(self):
+        b = f'''
+{DECK_MAIN}
+2 Fervent Champion
+1 Embercleave
+2x fervent champion
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+{DECK_SB}
+1 Embercleave
+4 Fervent Champion
+'''.strip().splitlines()
+        with patch('vim_mtg.database.interface') as interface:
+            actual_result = move_cards(b, [1, 2, 3], 2)
+        interface.assert_not_called()
+        self.assertEqual(actual_result, expected_result)
+
+    def test_invalid_card_discarded(self):
+        b = f'''
+{DECK_MAIN}
+2 Fervent Champion
+1 Pikachu
+{DECK_SB}
+'''.strip().splitlines()
+        expected_result = f'''
+{DECK_MAIN}
+{DECK_SB}
+2 Fervent Champion
+'''.strip().splitlines()
+        with patch('vim_mtg.deck.vim_warning') as vim_warning:
+            actual_result = move_cards(b, [1, 2], 2)
+        vim_warning.assert_called_once_with(
+            "invalid line discarded: '1 Pikachu'")
+        self.assertEqual(actual_result, expected_result)
+
 
 class LegalityTest(unittest.TestCase):
 
@@ -1184,6 +1562,37 @@ class LegalityTest(unittest.TestCase):
         self.assertEqual(actual_result, expected_result)
 
 
+class LegalityMaskTest(unittest.TestCase):
+
+    def test_card_masks(self):
+        c = get_card('Sol Ring', verbose=True)
+        masks = legality_masks(c)
+        self.assertEqual(format_names(masks.legal), {'commander'})
+        self.assertEqual(format_names(masks.restricted), {'vintage'})
+        self.assertEqual(format_names(masks.banned), {'legacy'})
+
+    def test_deck_mask(self):
+        b = f'''
+2 Fervent Champion
+2 Sol Ring
+'''.strip().splitlines()
+        deck = get_deck(b, verbose=True)
+        self.assertEqual(format_names(legal_mask(deck)), {'commander'})
+        self.assertEqual(legal_mask([]), 0)
+
+    def test_breakers_and_restricted(self):
+        b = f'''
+2 Fervent Champion
+2 Sol Ring
+'''.strip().splitlines()
+        deck = get_deck(b, verbose=True)
+        breakers = format_breakers(deck)
+        self.assertEqual(breakers['vintage'], ['Sol Ring'])
+        self.assertEqual(breakers['pauper'], ['Fervent Champion', 'Sol Ring'])
+        self.assertNotIn('commander', breakers)
+        self.assertEqual(restricted_counts(deck), {'vintage': 2})
+
+
 class LegalityPrintTest(unittest.TestCase):
 
     def test_standard_card(self):
@@ -1276,6 +1685,94 @@ R: 2   (50%)
         self.assertEqual(actual_result, expected_result)
 
 
+class DeckEntryTest(unittest.TestCase):
+
+    def test_derived_fields(self):
+        c = Card()
+        c.name = 'Boros Reckoner'
+        c.cmc = 7
+        c.manacost = '{R/W}{R/W}{R}'
+        c.type = 'Creature — Minotaur Wizard'
+        c.types = ['Creature']
+        c.formats = {'modern': 'Legal', 'vintage': 'Legal',
+                     'legacy': 'Banned'}
+        e = DeckEntry(c, 2)
+        self.assertEqual(e.cmc, 6)
+        self.assertEqual(e.category, 'Creatures')
+        self.assertFalse(e.is_land)
+        self.assertEqual(e.mana.pips, (('W', 2), ('R', 3)))
+        self.assertEqual(e.legal, (1 << SHOWN_FORMATS.index('modern'))
+                                  | (1 << SHOWN_FORMATS.index('vintage')))
+
+    def test_dict_compatible(self):
+        c = Card()
+        c.cmc = 1
+        e = DeckEntry(c, 2)
+        e['count'] += 1
+        self.assertEqual(e['count'], 3)
+        self.assertIs(e['card'], c)
+        self.assertEqual(e, {'card': c, 'count': 3})
+        with self.assertRaises(KeyError):
+            e['name']
+        self.assertEqual(mana_curve([e, {'card': c, 'count': 1}]),
+                         [0,4,0,0,0,0,0])
+
+
+class DeckStatsTest(unittest.TestCase):
+
+    def test_one_pass(self):
+        b = f'''
+2 Fervent Champion
+2 Sol Ring
+2 Island
+'''.strip().splitlines()
+        deck = get_deck(b, verbose=True)
+        stats = DeckStats(deck)
+        self.assertEqual(stats.total, total_cards(deck))
+        self.assertEqual(stats.mana_curve(), mana_curve(deck))
+        self.assertEqual(stats.devotion(), devotion(deck))
+        self.assertEqual(stats.legal_formats(), {'commander'})
+        self.assertEqual(stats.stats(), deck_stats(deck))
+
+    def test_add_remove(self):
+        b = f'''
+2 Fervent Champion
+2 Sol Ring
+2 Island
+'''.strip().splitlines()
+        deck = get_deck(b, verbose=True)
+        stats = DeckStats(deck)
+        stats.remove(deck[1])
+        expected = DeckStats([deck[0], deck[2]])
+        self.assertEqual(stats.total, 4)
+        self.assertEqual(stats.mana_curve(), expected.mana_curve())
+        self.assertEqual(stats.devotion(), expected.devotion())
+        self.assertEqual(stats.legal_formats(), expected.legal_formats())
+        self.assertEqual(stats.stats(), expected.stats())
+        stats.remove(deck[0])
+        stats.remove(deck[2])
+        self.assertEqual(stats.legal_formats(), set())
+        self.assertEqual(stats.mana_curve(), [0,0,0,0,0,0,0])
+
+    def test_remove_part(self):
+        b = f'''
+2 Fervent Champion
+2 Sol Ring
+'''.strip().splitlines()
+        deck = get_deck(b, verbose=True)
+        stats = DeckStats(deck)
+        copy = stats.copy()
+        # a part of the copies keeps the card in the legal formats
+        stats.remove({'card': deck[1].card, 'count': 1})
+        self.assertEqual(stats.total, 3)
+        self.assertEqual(stats.legal_formats(), {'commander'})
+        stats.remove({'card': deck[1].card, 'count': 1})
+        self.assertEqual(stats.legal_formats(),
+                         DeckStats(deck[:1]).legal_formats())
+        self.assertEqual(copy.total, 4)
+        self.assertEqual(copy.legal_formats(), {'commander'})
+
+
 class StatsTest(unittest.TestCase):
 
     def test_one_card(self):
@@ -0,0 +1,67 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import json
+import subprocess
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock
+
+sys.modules['vim'] = Mock()
+
+
+# modules imported by `mtg#init_python` (when a deck buffer is opened)
+INIT_MODULES = ['deck', 'card', 'cache', 'names', 'database', 'worker',
+                'profiler', 'vim_interface']
+
+# modules only imported on first use
+LAZY_MODULES = ['mtgcard.mtgdb', 'mtgcard.parser', 'mtgcard.mtgcard',
+                'mtgcard.colors', 'mtgcard.util', 'pprint', 'cProfile',
+                'pstats', 'tracemalloc']
+
+# import time budget of INIT_MODULES, in seconds (checked only if the
+# VIM_MTG_BENCH environment variable is set, since it depends on the machine)
+IMPORT_BUDGET = 0.1
+
+IMPORT_SCRIPT = '''
+import json, sys, time, types
+sys.modules['vim'] = types.ModuleType('vim')
+start = time.perf_counter()
+from vim_mtg import {modules}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed': elapsed,
+                  'imported': [m for m in {lazy!r} if m in sys.modules]}}))
+'''
+
+
+def import_init_modules():
+    """Return (elapsed, imported lazy modules) of a fresh interpreter."""
+    script = IMPORT_SCRIPT.format(modules=', '.join(INIT_MODULES),
+                                  lazy=LAZY_MODULES)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    out = subprocess.check_output([sys.executable, '-c', script], env=env)
+    result = json.loads(out)
+    return (result['elapsed'], result['imported'])
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_lazy_modules_not_imported(self):
+        (elapsed, imported) = import_init_modules()
+        self.assertEqual(imported, [])
+
+    @unittest.skipUnless(os.environ.get('VIM_MTG_BENCH'),
+                         'set VIM_MTG_BENCH=1 to check the import budget')
+    def test_import_budget(self):
+        # best of three, to ignore a cold file system cache
+        elapsed = min(import_init_modules()[0] for i in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import mana
+
+
+class ParseTest(unittest.TestCase):
+
+    def setUp(self):
+        mana.parse.cache_clear()
+
+    def test_empty(self):
+        self.assertEqual(mana.parse(None), mana.ManaCost((), (), 0, ''))
+        self.assertEqual(mana.parse(''), mana.ManaCost((), (), 0, ''))
+
+    def test_pips_and_generic(self):
+        m = mana.parse('{2}{R}{R}{W}')
+        self.assertEqual(m.pips, (('W', 1), ('R', 2)))
+        self.assertEqual(m.hybrid, ())
+        self.assertEqual(m.generic, 2)
+
+    def test_hybrid(self):
+        m = mana.parse('{R/G}{R}')
+        self.assertEqual(m.pips, (('R', 2), ('G', 1)))
+        self.assertEqual(m.hybrid, (('R', 'G'),))
+        self.assertEqual(m.generic, 0)
+
+    def test_memoized(self):
+        with patch('mtgcard.colors.colorize_mana',
+                   return_value=('ansi',)) as colorize_mana:
+            m = mana.parse('{1}{U}')
+            self.assertIs(mana.parse('{1}{U}'), m)
+        self.assertEqual(m.ansi, 'ansi')
+        colorize_mana.assert_called_once_with('{1}{U}', 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import tempfile
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from mtgcard.settings import SHOWN_FORMATS
+from vim_mtg import cache
+from vim_mtg import names
+
+
+class NamesFileTest(unittest.TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.tmp = tmpdir.name
+        self.dir = os.path.join(tmpdir.name, 'vim-mtg')
+        self.dbpath = None
+        patchers = [
+            patch.dict('os.environ', {'XDG_CACHE_HOME': tmpdir.name}),
+            patch('vim_mtg.database.interface'),
+            patch('vim_mtg.database.path', side_effect=lambda: self.dbpath),
+            patch('mtgcard.mtgcard.list_cards', side_effect=self.list_cards),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.queries = []
+
+    def list_cards(self, db, query, onlynames=False, onename=False):
+        self.queries.append(query)
+        if query == 'format:pauper':
+            return ('Shock\nCounterspell',)
+        return ('Shock\nCounterspell\nEmbercleave',)
+
+    def test_names_file(self):
+        fpath = names.names_file('pauper')
+        self.assertEqual(fpath, os.path.join(self.dir, 'names-pauper.txt'))
+        with open(fpath, encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'Shock\nCounterspell\n')
+        self.assertEqual(names.names_file('pauper'), fpath)
+        self.assertEqual(self.queries, ['format:pauper'])
+        self.assertEqual(names.names_file(''),
+                         os.path.join(self.dir, 'names-all.txt'))
+
+    def test_list_names(self):
+        self.assertEqual(names.list_names('pauper'), ['Shock', 'Counterspell'])
+        self.assertIsNone(cache.names)
+        self.assertEqual(len(names.list_names()), 3)
+        self.assertEqual(cache.names['shock'], 'Shock')
+        names.list_names('pauper')
+        self.assertEqual(self.queries, ['format:pauper', ''])
+
+    def test_load_index(self):
+        # no names file: the database is not queried
+        self.assertFalse(names.load_index())
+        self.assertIsNone(cache.names)
+        names.names_file()
+        self.assertTrue(names.load_index())
+        self.assertEqual(cache.names['embercleave'], 'Embercleave')
+        names.load_index()
+        self.assertEqual(self.queries, [''])
+
+    def test_write_names_files(self):
+        names.write_names_files()
+        self.assertEqual(len(self.queries), 1 + len(SHOWN_FORMATS))
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(
+            ['names-all.txt'] + ['names-%s.txt' % (f,) for f in SHOWN_FORMATS]))
+        # the name index is filled
+        self.assertEqual(cache.names['counterspell'], 'Counterspell')
+        # the files are rewritten
+        names.write_names_files()
+        self.assertEqual(len(self.queries), 2 * (1 + len(SHOWN_FORMATS)))
+        names.names_file('modern')
+        self.assertEqual(len(self.queries), 2 * (1 + len(SHOWN_FORMATS)))
+
+    def test_stale(self):
+        self.dbpath = os.path.join(self.tmp, 'mtg.db')
+        with open(self.dbpath, 'w') as f:
+            f.write('db')
+        os.utime(self.dbpath, (1000, 1000))
+        fpath = names.names_file('modern')
+        names.names_file('modern')
+        self.assertEqual(len(self.queries), 1)
+        # the database is updated outside Vim
+        os.utime(self.dbpath, (os.path.getmtime(fpath) + 10,) * 2)
+        names.names_file('modern')
+        self.assertEqual(len(self.queries), 2)
+
+    def test_no_database(self):
+        with patch('vim_mtg.database.interface',
+                   side_effect=FileNotFoundError):
+            with self.assertRaises(FileNotFoundError):
+                names.names_file('modern')
+        self.assertFalse(os.path.exists(
+            os.path.join(self.dir, 'names-modern.txt')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg.profiler import Profiler
+from vim_mtg.deck import process_deck
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_phases(self):
+        p = Profiler()
+        with p.run():
+            for i in range(2):
+                with p.phase('lookup'):
+                    pass
+            with p.phase('render'):
+                pass
+        self.assertEqual(list(p.phases), ['lookup', 'render'])
+        self.assertEqual(p.phases['lookup'][1], 2)
+        report = p.report()
+        self.assertEqual([l.split()[0] for l in report],
+                         ['phase', 'lookup', 'render', 'other', 'total'])
+
+    def test_captures(self):
+        p = Profiler(cprofile=True, memory=True)
+        with p.run():
+            [str(i) for i in range(100)]
+        report = p.report()
+        self.assertTrue(any(l.startswith('memory: peak') for l in report))
+        self.assertIn('cProfile:', report)
+
+    def test_process_deck(self):
+        b = '''
+Main
+4 Shock
+Sideboard
+2 Sol Ring
+'''.strip().splitlines()
+        p = Profiler()
+        with p.run():
+            process_deck(b, profiler=p)
+        self.assertEqual(set(p.phases),
+                         {'index', 'lookup', 'render', 'stats'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import sys
+import os
+
+root_dir = os.path.abspath(os.path.join( os.path.dirname( __file__ ), '..' ))
+python_dir = os.path.join(root_dir, 'python')
+sys.path.append(python_dir)
+
+import threading
+import unittest
+from tests import load_tests
+load_tests.__module__ = __name__
+from unittest.mock import Mock, patch
+
+sys.modules['vim'] = Mock()
+
+from vim_mtg import database
+from vim_mtg import worker
+
+
+class JobTest(unittest.TestCase):
+
+    def tearDown(self):
+        worker.jobs.clear()
+
+    def test_result(self):
+        job = worker.Job(lambda job, a, b=0: a + b, 1, b=2).start()
+        self.assertTrue(job.wait(5))
+        self.assertTrue(job.done())
+        self.assertEqual(job.result(), 3)
+
+    def test_error(self):
+        def fn(job):
+            raise FileNotFoundError('no database')
+        job = worker.Job(fn).start()
+        job.wait(5)
+        with self.assertRaises(FileNotFoundError):
+            job.result()
+
+    def test_progress(self):
+        release = threading.Event()
+        def fn(job):
+            job.set_progress('Main')
+            release.wait(5)
+        job = worker.Job(fn).start()
+        while job.progress != 'Main':
+            pass
+        self.assertFalse(job.done())
+        release.set()
+        job.wait(5)
+
+    def test_start_cancels_previous(self):
+        release = threading.Event()
+        first = worker.start(('process', 1), lambda job: release.wait(5))
+        self.assertTrue(worker.running(('process', 1)))
+        second = worker.start(('process', 1), lambda job: None)
+        self.assertTrue(first.cancelled)
+        self.assertIs(worker.jobs[('process', 1)], second)
+        release.set()
+        second.wait(5)
+        self.assertFalse(worker.running(('process', 1)))
+
+
+class WorkerThreadTest(unittest.TestCase):
+
+    def tearDown(self):
+        worker.jobs.clear()
+
+    def test_one_thread_per_lane(self):
+        threads = [worker.Job(lambda job: threading.current_thread()).start()
+                   for i in range(5)]
+        for job in threads:
+            self.assertTrue(job.wait(5))
+        self.assertEqual(len({job.result() for job in threads}), 1)
+        self.assertIsNot(threads[0].result(), threading.current_thread())
+        other = worker.Job(lambda job: threading.current_thread()).start(
+            lane='search')
+        other.wait(5)
+        self.assertIsNot(other.result(), threads[0].result())
+
+    def test_lanes_independent(self):
+        # a long run does not hold up a search
+        release = threading.Event()
+        process = worker.start(('process', 1), lambda job: release.wait(5))
+        search = worker.start(('search', 2), lambda job: 'found')
+        self.assertTrue(search.wait(5))
+        self.assertEqual(search.result(), 'found')
+        self.assertFalse(process.done())
+        release.set()
+        self.assertTrue(process.wait(5))
+
+    def test_interface_opened_once(self):
+        with patch('mtgcard.mtgdb.Interface') as interface:
+            database.close()
+            for i in range(10):
+                worker.start(('prefetch', 1),
+                             lambda job: database.interface()).wait(5)
+        self.assertEqual(interface.call_count, 1)
+
+    def test_cancelled_before_run(self):
+        release = threading.Event()
+        first = worker.Job(lambda job: release.wait(5)).start()
+        calls = []
+        second = worker.Job(lambda job: calls.append(1)).start()
+        second.cancel()
+        release.set()
+        self.assertTrue(second.wait(5))
+        self.assertIsNone(second.result())
+        self.assertEqual(calls, [])
+
+    def test_shutdown_closes_interfaces(self):
+        with patch('mtgcard.mtgdb.Interface', side_effect=Mock) as interface:
+            database.close()
+            for lane in ('process', 'search'):
+                worker.start((lane, 1), lambda job: database.interface()).wait(5)
+            dbs = [job.result() for job in worker.jobs.values()]
+            threads = [thread for (pending, thread) in worker._lanes.values()]
+            worker.shutdown(timeout=5)
+        self.assertEqual(interface.call_count, 2)
+        for db in dbs:
+            db.close.assert_called_once_with()
+        for thread in threads:
+            self.assertFalse(thread.is_alive())
+        # a new job starts a new thread
+        self.assertTrue(worker.Job(lambda job: None).start().wait(5))
+
+    def test_in_order(self):
+        order = []
+        jobs = [worker.Job(lambda job, i: order.append(i), i).start()
+                for i in range(5)]
+        jobs[-1].wait(5)
+        self.assertEqual(order, list(range(5)))
+
+
+if __name__ == '__main__':
+    unittest.main()